@@ -0,0 +1,269 @@
+from datetime import datetime, timedelta
+import asyncio
+import time
+from Game_observer import Observer, checked_clients
+from Odds_book import Odds_book, odds_records
+from Sportmonks_connector import Sportmonks_error, PRIORITY_LIVE_ODDS, PRIORITY_STATS, PRIORITY_METADATA
+from Livescores_parser import extract_fixtures
+from Metrics import TICK_SECONDS, EVALUATE_SECONDS, ACTIVE_OBSERVERS, record_signal
+
+# Held by the observer checking the connection, see Observer.connection_working
+check_lock = asyncio.Lock()
+
+class Async_observer(Observer):
+    """
+    Observer running as a coroutine on a shared event loop instead of in its own thread.
+    Evaluation and parsing are inherited from Observer, only the I/O is asynchronous.
+    """
+
+    def __init__(self, game_id, api_token, slack_notifications_channel, slack_errors_channel, slack_token, client, poller=None, cache=None, recorder=None, dispatcher=None, baselines=None, parse_pool=None):
+        """
+        client: Async_sportmonks_client shared by every observer on the event loop
+        poller: Async_livescores_poller shared by every observer, None to fetch livescores on its own
+        cache: Metadata_cache shared by every observer
+        recorder: Match_recorder writing the responses this observer sees, None to not record
+        dispatcher: Slack_dispatcher shared by every observer, so posting never blocks the event loop
+        baselines: Team_baselines shared by every observer
+        parse_pool: Parse_pool decoding the odds off the event loop, None to decode them on it
+        """
+        super().__init__(game_id, api_token, slack_notifications_channel, slack_errors_channel, slack_token, poller, client, cache, recorder, dispatcher, baselines, parse_pool)
+
+
+    async def connection_working(self):
+        """
+        Establishes a connection to the sportmonks API, see Observer.connection_working
+
+        @return: True if successful
+        """
+
+        async with check_lock:
+            if self.client in checked_clients:
+                return True
+
+            try:
+                # test request to see if any answer arrives
+                response = await self.client.get_json("/livescores/now", priority=PRIORITY_METADATA)
+            except Sportmonks_error as e:
+                # A slow or degraded API is not a wrong URL, the polls are skipped until it answers again
+                await asyncio.to_thread(self.report_failure, e.result)
+                checked_clients.add(self.client)
+                return True
+            except:
+                raise Exception("Connection could not be established, URL likely wrong")
+
+            if "error" in response:
+                raise Exception("Error recieved from API, auth token likely wrong")
+            print("token accepted by API")
+            checked_clients.add(self.client)
+
+        return True
+
+
+    async def game_is_live(self):
+        """
+        Check if game is live by requesting the fixture's time status
+
+        @return: True if game is live, False otherwise
+        """
+
+        try:
+            response = await self.client.get_json(f"/fixtures/{self.game_id}", priority=PRIORITY_STATS)
+        except Sportmonks_error as e:
+            await asyncio.to_thread(self.report_failure, e.result) # asked again on the next wait
+            return False
+        except:
+            raise Exception("Connection could not be established, game_id likely incorrect")
+
+        self.record("fixture", response)
+        self.remember_fixture(response["data"])
+        self.remember_time(response["data"])
+        return self.status_is_live(response)
+
+
+    async def wait_for_game_to_start(self):
+        """
+        Wait for maximum of 15 minutes for game to be reported as LIVE from sportmonks.
+
+        @return: True when game is live, False otherwise
+        """
+
+        print(f"Waiting for game {self.game_id} to start")
+        for i in range(45):
+            if await self.game_is_live():
+                print(f"{self.game_id} is now reported to be live, continues...")
+                await self.fetch_team_info()
+                return True
+            await asyncio.sleep(20)
+
+        await asyncio.to_thread(self.error_notificator.post_message, f'*{self.game_id}:* Game never reported to be live in its first 15 mins, observer terminating')
+        return False
+
+
+    async def promote(self, fixture):
+        """
+        Takes over a fixture an Async_status_watcher saw go live, see Observer.promote
+        """
+        self.record("fixture", {"data": fixture})
+        self.remember_fixture(fixture)
+        self.remember_time(fixture)
+        await self.fetch_team_info()
+
+
+    async def fetch_team_info(self):
+        """
+        Looks up both teams concurrently once the fixture is live, see Observer.fetch_team_info
+
+        @return: True if the teams are known
+        """
+        if not self.localteam_info:
+            try:
+                self.localteam_info, self.visitorteam_info = await asyncio.gather(
+                    self.fetch_team_from_id(str(self.localteam_id)),
+                    self.fetch_team_from_id(str(self.visitorteam_id)))
+            except Sportmonks_error as e:
+                await asyncio.to_thread(self.report_failure, e.result)
+                return False
+        return True
+
+
+    async def fetch_team_from_id(self, team_id):
+        """
+        Fetches the name and country of team id passed as argument
+
+        @return: team name, country
+        """
+
+        team = self.cache.get(f"team:{team_id}")
+        if team:
+            self.record("team", {"team_id": str(team_id), "team": team})
+            return tuple(team)
+
+        try:
+            response = await self.client.get_json(f"/teams/{team_id}", {"include":"country", "tz":str(self.timezone)}, PRIORITY_METADATA)
+        except Sportmonks_error:
+            raise # a slow or degraded API, see fetch_team_info
+        except:
+            await asyncio.to_thread(self.error_notificator.post_message, f'*{self.game_id} Exception:* Connection to soccer API could not be established')
+            raise Exception("Connection could not be established, URL likely wrong")
+
+        team = self.parse_team(response)
+        self.cache.put(f"team:{team_id}", team)
+        self.record("team", {"team_id": str(team_id), "team": team})
+        return team
+
+
+    async def fetch_current_data(self):
+        """
+        Fetches all relevant match data and builds a dictionary object suitable for evaluation/comparison
+
+        @return: dictionary of the match data, None if the API did not answer in time
+        """
+
+        # Get livescores, shared with every other observer if a poller is available. A slow or degraded API skips this poll
+        try:
+            if self.poller:
+                correct_match = await self.poller.get_fixture(self.game_id)
+            else:
+                params = {"tz": str(self.timezone), "include": "stats"}
+                correct_match = extract_fixtures(await self.client.get_bytes("/livescores/now", params, PRIORITY_STATS), [self.game_id]).get(str(self.game_id))
+        except Sportmonks_error as e:
+            await asyncio.to_thread(self.report_failure, e.result)
+            return None
+        except Exception as e:
+            await asyncio.to_thread(self.error_notificator.post_message, f'*{self.game_id} Exception:* {e}')
+            raise
+
+        # Throw error if this observer's match cant be found
+        if not correct_match:
+            await asyncio.to_thread(self.error_notificator.post_message, f"*{self.game_id} Exception:* Correct match could not be found in [...]/livescores/now ")
+            raise Exception(f"Correct match could not be found in [...]/livescores/now for match {self.game_id}")
+        self.record("livescores", correct_match)
+
+        # If not already saved, save the team names and countries, the poll is skipped until they are known
+        if not self.localteam_info:
+            self.remember_fixture(correct_match)
+            if not await self.fetch_team_info():
+                return None
+
+        return self.build_stats(correct_match)
+
+
+    async def fetch_current_odds(self):
+        """
+        Fetches the relevant odds for evaluate_situation() to be able to do its job
+
+        @return: list of bet365 asian handicap Odds_line objects, None if the API did not answer in time
+        """
+
+        # Hedged when slower than usual
+        params = {"tz":str(self.timezone)}
+        result = await self.client.fetch(f"/odds/inplay/fixture/{self.game_id}", params, PRIORITY_LIVE_ODDS, hedge=True)
+        if result.degraded:
+            await asyncio.to_thread(self.report_failure, result)
+            return None
+        if self.parse_pool and not self.recorder:
+            self.odds_book = Odds_book.from_records(await self.parse_pool.parse_async(odds_records, result.content))
+            return self.pick_odds()
+        response = result.json()
+        self.record("odds", response)
+        return self.extract_odds(response)
+
+
+    async def tick(self):
+        """
+        Fetches the current stats and odds concurrently, evaluates them and posts in slack
+        if a bet should be placed, see Observer.tick
+
+        @return: True if a bet notification was posted
+        """
+
+        started = time.perf_counter()
+        stats, odds = await asyncio.gather(self.fetch_current_data(), self.fetch_current_odds())
+        if stats is None or odds is None:
+            TICK_SECONDS.observe(time.perf_counter() - started, mode="asyncio")
+            return False
+        self.history.record(self.minute, stats, odds)
+        self.scheduler.record_odds(odds)
+        if not self.has_changed(stats, odds):
+            TICK_SECONDS.observe(time.perf_counter() - started, mode="asyncio")
+            return False
+        evaluate_started = time.perf_counter()
+        result = self.evaluate_situation(stats, odds)
+        EVALUATE_SECONDS.observe(time.perf_counter() - evaluate_started, mode="asyncio")
+        if result["bet"]:
+            record_signal(odds)
+            team = await self.fetch_team_from_id(result["onTeam"])
+            await asyncio.to_thread(self.notificator.post_message, f'A bet should be placed now, on *{result["onTeam"]}*, {team} on one of these good bets: *{result["odds"]}*')
+        TICK_SECONDS.observe(time.perf_counter() - started, mode="asyncio")
+        return result["bet"]
+
+
+    async def observe(self):
+        """
+        Observes the game specified by self.game_id, see Observer.observe
+        """
+
+        # calculate time to stop observing, unless resuming after a restart
+        if not self.match_ends:
+            self.match_ends = datetime.now() + timedelta(minutes=90)
+            self.muted_until = datetime.now()
+
+        # Event loop, the first wait lasts until the opening 10 minutes have been played, a resumed observer polls right away
+        ACTIVE_OBSERVERS.inc()
+        try:
+            while datetime.now() < self.match_ends:
+                if not self.restored:
+                    await asyncio.sleep(min(self.time_to_next_poll(self.muted_until), max((self.match_ends - datetime.now()).total_seconds(), 0)))
+                self.restored = False
+                # Iff not muted...
+                if (datetime.now() - self.muted_until).days == 0:
+                    if await self.tick():
+                        self.muted_until = datetime.now()+timedelta(minutes=15)
+        finally:
+            ACTIVE_OBSERVERS.dec()
+
+        if self.poller:
+            self.poller.unwatch(self.game_id)
+        if self.recorder:
+            self.recorder.close()
+        print(f"Match {self.game_id} ended")
@@ -0,0 +1,212 @@
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+import argparse
+import bisect
+import glob
+import importlib
+import json
+import os
+import sys
+from Match_recorder import read_recording
+from Metadata_cache import Metadata_cache
+
+class Replay_feed:
+
+    def __init__(self, records):
+        """
+        Recorded responses of one match, indexed by kind and time
+
+        records: list of records from Match_recorder.read_recording
+        """
+        self.game_id = None
+        self.times = {}
+        self.payloads = {}
+        for record in sorted(records, key=lambda r: r["t"]):
+            if record["kind"] == "meta":
+                self.game_id = record["data"]["game_id"]
+                continue
+            self.times.setdefault(record["kind"], []).append(record["t"])
+            self.payloads.setdefault(record["kind"], []).append(record["data"])
+
+        all_times = [t for times in self.times.values() for t in times]
+        self.start = min(all_times) if all_times else 0
+        self.end = max(all_times) if all_times else 0
+
+
+    def latest(self, kind, t):
+        """
+        Finds the response of a kind the observer would have seen at time t
+
+        @return: the newest payload recorded at or before t, the first one if t is before it, None if never recorded
+        """
+        times = self.times.get(kind)
+        if not times:
+            return None
+        return self.payloads[kind][max(bisect.bisect_right(times, t) - 1, 0)]
+
+
+class Replay_response:
+    degraded = False
+
+    def __init__(self, data):
+        self.data = data
+
+    def json(self):
+        return self.data
+
+    @property
+    def content(self):
+        return json.dumps(self.data).encode()
+
+
+class Replay_client:
+
+    def __init__(self, feed, observer):
+        """
+        Stand-in for Sportmonks_client serving the recorded responses at the observer's virtual time
+        """
+        self.feed = feed
+        self.observer = observer
+
+
+    def get(self, path, params=None, priority=None):
+        t = self.observer.clock
+        if path.startswith("/odds/inplay/fixture/"):
+            return Replay_response(self.feed.latest("odds", t) or {"data": []})
+        if path.startswith("/fixtures/"):
+            return Replay_response(self.feed.latest("fixture", t))
+        if path.startswith("/livescores/now"):
+            fixture = self.feed.latest("livescores", t)
+            return Replay_response({"data": [fixture] if fixture else []})
+        raise Exception(f"{path} was not recorded")
+
+
+    def fetch(self, path, params=None, priority=None, hedge=False):
+        return self.get(path, params, priority)
+
+
+class Replay_bot:
+
+    def __init__(self, observer, messages):
+        """
+        Stand-in for Slack_message_bot collecting the posted messages with their virtual time
+        """
+        self.observer = observer
+        self.messages = messages
+
+    def connect(self):
+        return True
+
+    def post_message(self, message):
+        self.messages.append({"minute": self.observer.minute, "time": self.observer.clock, "message": message})
+        return True
+
+
+def replay_observer_class(observer_class):
+    """
+    Builds a subclass of observer_class driven by a recording instead of the API,
+    with a virtual clock in place of time.sleep and Slack posting collected in lists
+
+    @return: the replay observer class
+    """
+
+    class Replay_observer(observer_class):
+
+        def __init__(self, feed):
+            self.clock = feed.start
+            self.decisions = []
+            self.notifications = []
+            self.errors = []
+
+            # Team info is served from the recording through the cache
+            cache = Metadata_cache()
+            for record in feed.payloads.get("team", []):
+                cache.put(f"team:{record['team_id']}", record["team"])
+
+            super().__init__(feed.game_id, None, None, None, None, client=Replay_client(feed, self), cache=cache)
+            self.notificator = Replay_bot(self, self.notifications)
+            self.error_notificator = Replay_bot(self, self.errors)
+
+        def now(self):
+            return datetime.fromtimestamp(self.clock)
+
+        def sleep(self, seconds):
+            self.clock += seconds
+
+        def evaluate_situation(self, stats, odds):
+            result = super().evaluate_situation(stats, odds)
+            self.decisions.append({"minute": self.minute, "result": result})
+            return result or {"bet": False}
+
+    return Replay_observer
+
+
+def load_observer_class(observer_spec):
+    """
+    Imports an observer class from a "module:Class" string, ex: "Game_observer:Observer"
+
+    @return: the class
+    """
+    module_name, class_name = observer_spec.split(":")
+    if os.getcwd() not in sys.path:
+        sys.path.insert(0, os.getcwd()) # strategies may live next to the recordings, outside the repo
+    return getattr(importlib.import_module(module_name), class_name)
+
+
+def replay_match(path, observer_spec="Game_observer:Observer"):
+    """
+    Replays one recorded match as fast as the CPU allows
+
+    path: recording written by Match_recorder
+    observer_spec: observer class whose evaluate_situation is tested, as "module:Class"
+
+    @return: dictionary summarising the replay
+    """
+
+    feed = Replay_feed(read_recording(path))
+    o = replay_observer_class(load_observer_class(observer_spec))(feed)
+    summary = {"recording": path, "game_id": feed.game_id, "error": None}
+
+    try:
+        if o.wait_for_game_to_start():
+            o.observe()
+    except Exception as e:
+        summary["error"] = str(e)
+
+    summary["ticks"] = len(o.decisions)
+    summary["bets"] = [d for d in o.decisions if d["result"] and d["result"].get("bet")]
+    summary["notifications"] = o.notifications
+    summary["errors"] = o.errors
+    return summary
+
+
+def run_backtest(paths, observer_spec="Game_observer:Observer", processes=None):
+    """
+    Replays many recorded matches in parallel in a process pool
+
+    paths: list of recordings
+    observer_spec: observer class whose evaluate_situation is tested, as "module:Class"
+    processes: Number of worker processes, defaults to the number of cores
+
+    @return: list of replay summaries, in the order of paths
+    """
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        return list(pool.map(replay_match, paths, [observer_spec]*len(paths)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay recorded matches through an observer strategy")
+    parser.add_argument("recordings", nargs="+", help="recordings or glob patterns, ex: recordings/*.jsonl.gz")
+    parser.add_argument("--observer", default="Game_observer:Observer", help="observer class to test, as module:Class")
+    parser.add_argument("--processes", type=int, default=None, help="number of worker processes")
+    args = parser.parse_args()
+
+    paths = sorted(set(p for pattern in args.recordings for p in glob.glob(pattern)))
+    summaries = run_backtest(paths, args.observer, args.processes)
+
+    for s in summaries:
+        print(f'{s["game_id"]}: {s["ticks"]} ticks, {len(s["bets"])} bets, {len(s["notifications"])} notifications' + (f', stopped: {s["error"]}' if s["error"] else ""))
+    print(f'{len(summaries)} matches replayed, {sum(len(s["bets"]) for s in summaries)} bets')
+
+if __name__ == "__main__":
+    main()
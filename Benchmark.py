@@ -0,0 +1,196 @@
+from concurrent.futures import ThreadPoolExecutor
+import argparse
+import json
+import multiprocessing
+import resource
+import socket
+import time
+import tracemalloc
+import requests
+from Game_observer import Observer
+from Fake_services import Fake_services, Simulated_match, FIRST_FIXTURE_ID
+from Livescores_parser import extract_fixtures, loads, orjson
+from Livescores_poller import Livescores_poller
+from Metadata_cache import Metadata_cache
+from Parse_pool import Parse_pool
+from Slack_connector import Slack_dispatcher
+from Sportmonks_connector import Sportmonks_client
+
+class Benchmark_observer(Observer):
+    """
+    Observer betting on the localteam every time bet365 updates its asian handicap odds,
+    so every odds update ends in a notification whose latency can be measured
+    """
+
+    def evaluate_situation(self, stats, odds):
+        updated_at = max([line.last_update or 0 for line in odds] + [0])
+        seen = getattr(self, "seen_update", None)
+        self.seen_update = updated_at
+        if seen is None or updated_at <= seen:
+            return {"bet": False}
+        return {"bet": True, "onTeam": self.localteam_id, "odds": [line.value for line in odds[:2]]}
+
+
+def serve(n_matches, port, seconds_per_minute, odds_interval):
+    """
+    Runs the fake services in their own process, so their CPU doesn't count against the bot
+    """
+    Fake_services(n_matches, port=port, seconds_per_minute=seconds_per_minute, odds_interval=odds_interval).server.serve_forever()
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def api_calls(base_url):
+    """
+    @return: number of sportmonks requests the fake services have answered so far
+    """
+    counts = requests.get(base_url + "/_stats").json()["counts"]
+    return sum(n for endpoint, n in counts.items() if endpoint != "slack")
+
+
+def percentile(values, share):
+    if not values:
+        return float("nan")
+    values = sorted(values)
+    return values[min(int(share * len(values)), len(values) - 1)]
+
+
+def run_scenario(n_fixtures, ticks=5, interval=10.0, odds_interval=5.0, workers=64, parse_workers=0):
+    """
+    Observes n_fixtures simulated matches for a number of ticks, the way app.main runs them
+
+    n_fixtures: Number of simulated concurrent matches
+    ticks: Number of observer ticks to measure
+    interval: Seconds between two ticks
+    odds_interval: Seconds between two odds updates of a simulated match
+    parse_workers: Number of Parse_pool worker processes decoding the responses, 0 to decode in the observer threads
+
+    @return: dictionary of the measurements
+    """
+
+    port = free_port()
+    server = multiprocessing.Process(target=serve, args=(n_fixtures, port, 1.0, odds_interval), daemon=True)
+    server.start()
+    base_url = f"http://127.0.0.1:{port}"
+    for i in range(100):
+        try:
+            requests.get(base_url + "/_stats")
+            break
+        except requests.ConnectionError:
+            time.sleep(0.1)
+
+    parse_pool = Parse_pool(parse_workers) if parse_workers else None
+    try:
+        client = Sportmonks_client("benchmark", hourly_limit=10**9, pool_size=workers, base_url=base_url + "/api/v2.0")
+        poller = Livescores_poller(client, interval=interval / 2, parse_pool=parse_pool)
+        cache = Metadata_cache()
+        dispatcher = Slack_dispatcher("benchmark", base_url=base_url + "/slack/api/", channel_interval=0, priority_channels=["notifications"]).start()
+        observers = [Benchmark_observer(FIRST_FIXTURE_ID + i, "benchmark", "notifications", "errors", "benchmark", poller, client, cache, dispatcher=dispatcher, parse_pool=parse_pool) for i in range(n_fixtures)]
+
+        tick_durations = []
+        cpu_durations = []
+        with ThreadPoolExecutor(max_workers=min(workers, n_fixtures)) as pool:
+            # Warm up: team lookups and the first odds snapshot
+            list(pool.map(lambda o: o.tick(), observers))
+            calls_before = api_calls(base_url)
+
+            for i in range(ticks):
+                started, cpu_started = time.perf_counter(), time.process_time()
+                list(pool.map(lambda o: o.tick(), observers))
+                tick_durations.append(time.perf_counter() - started)
+                cpu_durations.append(time.process_time() - cpu_started)
+                time.sleep(max(0, interval - tick_durations[-1]))
+
+        dispatcher.flush(timeout=30)
+        calls = api_calls(base_url) - calls_before
+        stats = requests.get(base_url + "/_stats").json()
+        signal_latencies = [m["received_at"] - m["odds_updated_at"] for m in stats["slack_messages"] if m["odds_updated_at"]]
+    finally:
+        server.terminate()
+        if parse_pool:
+            parse_pool.shutdown()
+
+    return {
+        "fixtures": n_fixtures,
+        "api_calls_per_tick": calls / ticks,
+        "tick_ms_mean": 1000 * sum(tick_durations) / ticks,
+        "tick_ms_p95": 1000 * percentile(tick_durations, 0.95),
+        "cpu_ms_per_tick": 1000 * sum(cpu_durations) / ticks,
+        "max_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "signal_ms_mean": 1000 * sum(signal_latencies) / len(signal_latencies) if signal_latencies else float("nan"),
+        "signal_ms_p95": 1000 * percentile(signal_latencies, 0.95),
+    }
+
+
+def measure(parse, repeats):
+    """
+    @return: mean parse time in ms, peak traced memory in MB of one parse
+    """
+    started = time.perf_counter()
+    for i in range(repeats):
+        parse()
+    duration = (time.perf_counter() - started) / repeats
+
+    tracemalloc.start()
+    parse()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return 1000 * duration, peak / 2**20
+
+
+def parse_scenario(n_fixtures, watched=10, repeats=20):
+    """
+    Compares decoding a whole /livescores/now?include=stats response with the app's decoder, orjson
+    if installed, and picking the watched fixtures out of it, with extracting only the watched fixtures from the raw bytes
+
+    n_fixtures: Number of live matches in the response
+    watched: Number of those matches being observed
+
+    @return: dictionary of the measurements
+    """
+
+    now = time.time()
+    body = json.dumps({"data": [Simulated_match(FIRST_FIXTURE_ID + i, now - 900, 1.0, 5.0).fixture(now) for i in range(n_fixtures)]}).encode()
+    ids = [FIRST_FIXTURE_ID + i for i in range(0, n_fixtures, max(n_fixtures // watched, 1))][:watched]
+
+    def full():
+        return {str(i["id"]): i for i in loads(body)["data"] if i["id"] in ids}
+
+    assert full() == extract_fixtures(body, ids)
+    result = {"fixtures": n_fixtures, "response_mb": len(body) / 2**20}
+    result["full_ms"], result["full_mb"] = measure(full, repeats)
+    result["extract_ms"], result["extract_mb"] = measure(lambda: extract_fixtures(body, ids), repeats)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the observers against the local fake services")
+    parser.add_argument("--fixtures", type=int, nargs="+", default=[10, 100, 1000], help="numbers of concurrent matches to test")
+    parser.add_argument("--ticks", type=int, default=5)
+    parser.add_argument("--interval", type=float, default=10.0, help="seconds between ticks")
+    parser.add_argument("--odds-interval", type=float, default=5.0, help="seconds between odds updates of a match")
+    parser.add_argument("--parse", action="store_true", help="only compare the livescores parsing paths")
+    parser.add_argument("--parse-workers", type=int, default=0, help="number of processes decoding the responses, 0 to decode in the observer threads")
+    args = parser.parse_args()
+
+    if args.parse:
+        print(f"Decoding with {'orjson' if orjson else 'json'}")
+        columns = ("fixtures", "response_mb", "full_ms", "full_mb", "extract_ms", "extract_mb")
+        print(" ".join(f"{c:>12}" for c in columns))
+        for n in args.fixtures:
+            result = parse_scenario(n)
+            print(" ".join(f"{result[c]:>12.2f}" for c in columns))
+        return
+
+    columns = ("fixtures", "api_calls_per_tick", "tick_ms_mean", "tick_ms_p95", "cpu_ms_per_tick", "max_rss_mb", "signal_ms_mean", "signal_ms_p95")
+    print(" ".join(f"{c:>18}" for c in columns))
+    for n in args.fixtures:
+        result = run_scenario(n, args.ticks, args.interval, args.odds_interval, parse_workers=args.parse_workers)
+        print(" ".join(f"{result[c]:>18.1f}" for c in columns))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,277 @@
+from datetime import datetime, timezone
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+import argparse
+import json
+import math
+import random
+import re
+import threading
+import time
+
+HANDICAPS = [h / 4 for h in range(-8, 9)] # -2.0 to 2.0 in quarter goals
+BOOKMAKERS = ("bet365", "Pinnacle")
+FIRST_FIXTURE_ID = 17000000
+
+
+class Simulated_match:
+
+    def __init__(self, fixture_id, started_at, seconds_per_minute, odds_interval):
+        """
+        A live match whose stats and odds evolve with wall clock time
+
+        fixture_id: id of the simulated fixture
+        started_at: unix time of the simulated kickoff
+        seconds_per_minute: real seconds per simulated match minute
+        odds_interval: real seconds between two odds updates
+        """
+        self.fixture_id = fixture_id
+        self.localteam_id = fixture_id * 2
+        self.visitorteam_id = fixture_id * 2 + 1
+        self.started_at = started_at
+        self.seconds_per_minute = seconds_per_minute
+        self.odds_interval = odds_interval
+
+        # Per match rates, so every fixture plays differently but reproducibly
+        rng = random.Random(fixture_id)
+        self.attack_rates = (rng.uniform(0.8, 1.6), rng.uniform(0.8, 1.6))
+        self.danger_share = (rng.uniform(0.3, 0.7), rng.uniform(0.3, 0.7))
+        self.shot_rates = (rng.uniform(0.05, 0.2), rng.uniform(0.05, 0.2))
+        self.odds_phase = rng.uniform(0, odds_interval)
+        self.strength = rng.uniform(-1, 1)
+
+
+    def minute(self, now):
+        return min(int((now - self.started_at) / self.seconds_per_minute), 95)
+
+
+    def odds_updated_at(self, now):
+        """
+        @return: unix time of the latest odds update at or before now
+        """
+        updates = math.floor((now - self.started_at - self.odds_phase) / self.odds_interval)
+        return self.started_at + self.odds_phase + max(updates, 0) * self.odds_interval
+
+
+    def team_stats(self, team, now):
+        minute = self.minute(now)
+        attacks = int(minute * self.attack_rates[team])
+        shots = int(minute * self.shot_rates[team])
+        return {
+            "team_id": self.visitorteam_id if team else self.localteam_id,
+            "fixture_id": self.fixture_id,
+            "shots": {"total": shots, "ongoal": shots // 2, "offgoal": shots - shots // 2, "blocked": None, "insidebox": None, "outsidebox": None},
+            "passes": None,
+            "attacks": {"attacks": attacks, "dangerous_attacks": int(attacks * self.danger_share[team])},
+            "fouls": None, "corners": minute // 15, "offsides": None,
+            "possessiontime": 50 + int(10 * self.strength) * (-1 if team else 1),
+            "yellowcards": minute // 40, "redcards": 0, "yellowredcards": None, "saves": None,
+            "substitutions": max(0, minute - 60) // 10, "goal_kick": None, "goal_attempts": None,
+            "free_kick": None, "throw_in": None, "ball_safe": None, "goals": None,
+            "penalties": None, "injuries": None, "tackles": None,
+        }
+
+
+    def fixture(self, now):
+        minute = self.minute(now)
+        kickoff = datetime.fromtimestamp(self.started_at, timezone.utc)
+        return {
+            "id": self.fixture_id,
+            "league_id": 8,
+            "season_id": 17420,
+            "localteam_id": self.localteam_id,
+            "visitorteam_id": self.visitorteam_id,
+            "scores": {"localteam_score": minute // 40, "visitorteam_score": minute // 55},
+            "time": {
+                "status": "HT" if 45 <= minute < 47 else ("FT" if minute >= 95 else "LIVE"),
+                "starting_at": {"date_time": kickoff.strftime("%Y-%m-%d %H:%M:%S"), "date": kickoff.strftime("%Y-%m-%d"), "time": kickoff.strftime("%H:%M:%S"), "timestamp": int(self.started_at), "timezone": "UTC"},
+                "minute": minute, "second": None, "added_time": None, "extra_minute": None, "injury_time": None,
+            },
+            "stats": {"data": [self.team_stats(0, now), self.team_stats(1, now)]},
+        }
+
+
+    def odds(self, now):
+        updated_at = self.odds_updated_at(now)
+        step = round((updated_at - self.started_at - self.odds_phase) / self.odds_interval)
+        last_update = {"date": datetime.fromtimestamp(updated_at, timezone.utc).strftime("%Y-%m-%d %H:%M:%S.%f"), "timezone_type": 3, "timezone": "UTC"}
+
+        def lines(bookmaker_shift, market_scale):
+            data = []
+            for handicap in HANDICAPS:
+                drift = 0.1 * math.sin(step / 3 + handicap)
+                home = max(1.01, round(1.95 * market_scale + self.strength * 0.3 + handicap * 0.4 + drift + bookmaker_shift, 2))
+                away = max(1.01, round(1 / max(1 - 1 / home, 0.01), 2))
+                for label, value, sign in (("1", home, 1), ("2", away, -1)):
+                    data.append({"label": label, "value": f"{value:.2f}", "extra": None, "probability": f"{100 / value:.2f}%", "dp3": f"{value:.3f}",
+                                 "american": None, "factional": None, "handicap": f"{sign * handicap:.2f}", "total": None, "winning": None,
+                                 "stop": False, "bookmaker_event_id": self.fixture_id, "last_update": last_update})
+            return data
+
+        markets = []
+        for name, scale in (("Asian Handicap", 1.0), ("Asian Handicap First Half", 1.1)):
+            bookmakers = [{"id": i + 1, "name": b, "odds": {"data": lines(0.03 * i, scale)}} for i, b in enumerate(BOOKMAKERS)]
+            markets.append({"id": len(markets) + 1, "name": name, "suspended": False, "bookmaker": {"data": bookmakers}})
+        return {"data": markets}
+
+
+class Fake_services:
+
+    def __init__(self, n_matches, host="127.0.0.1", port=0, seconds_per_minute=1.0, odds_interval=5.0):
+        """
+        Local stand-in for the sportmonks API and the slack web API, serving n_matches simulated
+        concurrent matches. Point the bot at it with SPORTMONKS_BASE_URL=self.base_url and
+        SLACK_BASE_URL=self.slack_base_url
+
+        n_matches: Number of simulated live matches
+        seconds_per_minute: real seconds per simulated match minute
+        odds_interval: real seconds between two odds updates of a match
+        """
+        started_at = time.time() - 15 * seconds_per_minute # matches are 15 minutes in when the server starts
+        self.matches = {FIRST_FIXTURE_ID + i: Simulated_match(FIRST_FIXTURE_ID + i, started_at, seconds_per_minute, odds_interval) for i in range(n_matches)}
+        self.teams = {m.localteam_id: m for m in self.matches.values()}
+        self.teams.update({m.visitorteam_id: m for m in self.matches.values()})
+        self.counts = {}
+        self.slack_messages = []
+        self.lock = threading.Lock()
+        self.server = ThreadingHTTPServer((host, port), self.handler_class())
+        self.server.daemon_threads = True
+        self.base_url = f"http://{host}:{self.server.server_port}/api/v2.0"
+        self.slack_base_url = f"http://{host}:{self.server.server_port}/slack/api/"
+
+
+    def count(self, endpoint):
+        with self.lock:
+            self.counts[endpoint] = self.counts.get(endpoint, 0) + 1
+
+
+    def route(self, path, now):
+        """
+        @return: endpoint name, json serializable response
+        """
+        parts = path.strip("/").split("/")[2:] # drop "api/v2.0"
+        if parts[:2] == ["livescores", "now"]:
+            return "livescores", {"data": [m.fixture(now) for m in self.matches.values()]}
+        if parts[:3] == ["odds", "inplay", "fixture"] and int(parts[3]) in self.matches:
+            return "odds", self.matches[int(parts[3])].odds(now)
+        if parts[:2] == ["fixtures", "date"]:
+            return "fixtures_date", {"data": [m.fixture(now) for m in self.matches.values()]}
+        if parts[:2] == ["fixtures", "multi"]:
+            ids = [int(i) for i in parts[2].split(",") if i]
+            return "fixtures_multi", {"data": [self.matches[i].fixture(now) for i in ids if i in self.matches]}
+        if parts[:2] == ["fixtures", "between"] and len(parts) == 5:
+            return "fixtures_between", {"data": self.past_fixtures(int(parts[4]), parts[2], parts[3])}
+        if parts[0] == "fixtures" and len(parts) == 2 and int(parts[1]) in self.matches:
+            return "fixture", {"data": self.matches[int(parts[1])].fixture(now)}
+        if parts[0] == "teams" and len(parts) == 2 and int(parts[1]) in self.teams:
+            team_id = int(parts[1])
+            return "team", {"data": {"id": team_id, "name": f"Team {team_id}", "country": {"data": {"name": "Simland"}}}}
+        return "not_found", {"error": {"message": f"{path} not found", "code": 404}}
+
+
+    def past_fixtures(self, team_id, first_day, last_day):
+        """
+        Finished fixtures of a team, one a week from last_day back to first_day, so a baseline build has history to read
+
+        first_day, last_day: ISO dates of the period, both included
+
+        @return: list of fixtures at full time, empty if the team is unknown
+        """
+        match = self.teams.get(team_id)
+        if not match:
+            return []
+        first = datetime.strptime(first_day, "%Y-%m-%d").replace(tzinfo=timezone.utc).timestamp()
+        kickoff = datetime.strptime(last_day, "%Y-%m-%d").replace(hour=15, tzinfo=timezone.utc).timestamp()
+        fixtures = []
+        while kickoff >= first:
+            # Same teams and rates as the live match, played to the final whistle
+            past = Simulated_match(match.fixture_id, kickoff, match.seconds_per_minute, match.odds_interval)
+            fixture = past.fixture(kickoff + 95 * match.seconds_per_minute)
+            fixture["id"] = match.fixture_id * 1000 + len(fixtures) + 1
+            fixtures.append(fixture)
+            kickoff -= 7 * 86400
+        return fixtures
+
+
+    def odds_updated_at(self, team_id, before):
+        """
+        @return: unix time of the latest odds update of a team's match at or before a moment, None if unknown
+        """
+        match = self.teams.get(int(team_id))
+        return match.odds_updated_at(before) if match else None
+
+
+    def handler_class(self):
+        services = self
+
+        class Handler(BaseHTTPRequestHandler):
+
+            def log_message(self, *args):
+                pass
+
+            def reply(self, status, body):
+                payload = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                if url.path == "/_stats":
+                    with services.lock:
+                        return self.reply(200, {"counts": dict(services.counts), "slack_messages": list(services.slack_messages)})
+                endpoint, body = services.route(url.path, time.time())
+                services.count(endpoint)
+                self.reply(404 if endpoint == "not_found" else 200, body)
+
+            def do_POST(self):
+                received_at = time.time()
+                body = self.rfile.read(int(self.headers.get("Content-Length") or 0)).decode()
+                if "json" in (self.headers.get("Content-Type") or ""):
+                    fields = json.loads(body or "{}")
+                else:
+                    fields = {k: v[0] for k, v in parse_qs(body).items()}
+                services.count("slack")
+
+                # Bet notifications name the team, which tells the odds update they react to
+                text = fields.get("text") or ""
+                team = re.search(r"on \*(\d+)\*", text)
+                odds_updated_at = services.odds_updated_at(team.group(1), received_at) if team else None
+                with services.lock:
+                    services.slack_messages.append({"received_at": received_at, "odds_updated_at": odds_updated_at, "channel": fields.get("channel"), "text": text})
+                self.reply(200, {"ok": True, "channel": fields.get("channel"), "ts": str(received_at)})
+
+        return Handler
+
+
+    def start(self):
+        """
+        Serves in a background thread
+
+        @return: self
+        """
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve simulated sportmonks and slack APIs")
+    parser.add_argument("--matches", type=int, default=100, help="number of simulated live matches")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--seconds-per-minute", type=float, default=1.0, help="real seconds per simulated match minute")
+    parser.add_argument("--odds-interval", type=float, default=5.0, help="real seconds between odds updates")
+    args = parser.parse_args()
+
+    services = Fake_services(args.matches, port=args.port, seconds_per_minute=args.seconds_per_minute, odds_interval=args.odds_interval)
+    print(f"SPORTMONKS_BASE_URL={services.base_url}\nSLACK_BASE_URL={services.slack_base_url}")
+    services.server.serve_forever()
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,24 @@
 from datetime import datetime, timedelta
-from requests import get
-import requests
+import threading
 import time
+import weakref
 from Slack_connector import Slack_message_bot
+from Metadata_cache import Metadata_cache
+from Odds_book import Odds_book, Odds_diff, Odds_tracker, BET365, odds_records
+from Match_history import Match_history, history_capacity
+from Poll_scheduler import Poll_scheduler
+from Sportmonks_connector import Sportmonks_client, Sportmonks_error, PRIORITY_LIVE_ODDS, PRIORITY_STATS, PRIORITY_METADATA, CIRCUIT_OPEN_ERROR
+from Livescores_parser import extract_fixtures
+from Team_baselines import Team_baselines
+from Metrics import TICK_SECONDS, EVALUATE_SECONDS, ACTIVE_OBSERVERS, record_signal
+
+# Clients whose connection was checked, once per process instead of one /livescores/now download per observer
+checked_clients = weakref.WeakSet()
+check_lock = threading.Lock()
 
 class Observer:
 
-    def __init__(self, game_id, api_token, slack_notifications_channel, slack_errors_channel, slack_token):
+    def __init__(self, game_id, api_token, slack_notifications_channel, slack_errors_channel, slack_token, poller=None, client=None, cache=None, recorder=None, dispatcher=None, baselines=None, parse_pool=None):
         self.game_id = game_id
         self.timezone = "CEST"
         self.api_token = api_token
@@ -14,30 +26,70 @@ class Observer:
         self.visitorteam_info = None
         self.localteam_id = None
         self.visitorteam_id = None
+        self.odds_book = None
+        self.minute = None
+        self.status = None
+        self.match_ends = None # end of the observation, set when it starts
+        self.muted_until = None # no bet notifications are sent before this time
+        self.restored = False
+        self.odds_tracker = Odds_tracker()
+        self.odds_changes = Odds_diff()
+        self.last_stats = None
         self.slacktoken = slack_token
         self.notifications_channel = slack_notifications_channel
         self.errors_channel = slack_errors_channel
 
+        # Create messaging bots and establish their connections, through the shared dispatcher if available
+        self.notificator = Slack_message_bot(slack_token, slack_notifications_channel, dispatcher=dispatcher)
+        self.notificator.connect()
+        self.error_notificator = Slack_message_bot(slack_token, slack_errors_channel, dispatcher=dispatcher, coalesce=True)
+        self.error_notificator.connect()
+        self.poller = poller
+        self.client = client or Sportmonks_client(api_token)
+        self.cache = cache or Metadata_cache()
+        self.recorder = recorder
+        self.scheduler = Poll_scheduler(getattr(self.client, "bucket", None))
+        self.history = Match_history(history_capacity(self.scheduler.min_interval)) # every poll of the match, at the fastest schedule
+        self.baselines = baselines if baselines is not None else Team_baselines(None)
+        self.parse_pool = parse_pool
+
+        # Team ids may already be known from an earlier run
+        fixture = self.cache.get(f"fixture:{self.game_id}")
+        if fixture:
+            self.localteam_id = fixture["localteam_id"]
+            self.visitorteam_id = fixture["visitorteam_id"]
+
 
     def connection_working(self):
         """
         Establishes a connection to the sportmonks API
-        using the credentials & tokens in credentials.json
+        using the credentials & tokens in credentials.json.
+        Checked by the first observer of the process, the others wait for it and reuse its answer
 
         @return: True if successful
         """
 
-        try:
-            # test request to see if any answer arrives
-            raw_response = requests.get(url="https://soccer.sportmonks.com/api/v2.0/livescores/now", params={"api_token": self.api_token})
-        except:
-            raise Exception("Connection could not be established, URL likely wrong")
+        with check_lock:
+            if self.client in checked_clients:
+                return True
 
-        try:# TODO: change this to something more elegant
-            if raw_response.json()["error"]:
-                raise Exception("Error recieved from API, auth token likely wrong")
-        except:
-            print("token accepted by API")
+            try:
+                # test request to see if any answer arrives
+                raw_response = self.client.get("/livescores/now", priority=PRIORITY_METADATA)
+            except Sportmonks_error as e:
+                # A slow or degraded API is not a wrong URL, the polls are skipped until it answers again
+                self.report_failure(e.result)
+                checked_clients.add(self.client)
+                return True
+            except:
+                raise Exception("Connection could not be established, URL likely wrong")
+
+            try:# TODO: change this to something more elegant
+                if raw_response.json()["error"]:
+                    raise Exception("Error recieved from API, auth token likely wrong")
+            except:
+                print("token accepted by API")
+            checked_clients.add(self.client)
 
         return True
 
@@ -50,11 +102,53 @@ class Observer:
         """
 
         try:
-            raw_response = requests.get(url=f"https://soccer.sportmonks.com/api/v2.0/fixtures/{self.game_id}", params={"api_token": self.api_token})
+            raw_response = self.client.get(f"/fixtures/{self.game_id}", priority=PRIORITY_STATS)
+        except Sportmonks_error as e:
+            self.report_failure(e.result) # asked again on the next wait
+            return False
         except:
             raise Exception("Connection could not be established, game_id likely incorrect")
 
         response = raw_response.json()
+        self.record("fixture", response)
+        self.remember_fixture(response["data"])
+        self.remember_time(response["data"])
+        return self.status_is_live(response)
+
+
+    def remember_fixture(self, fixture):
+        """
+        Saves the team ids of this observer's fixture, in the observer and in the metadata cache
+
+        fixture: fixture dictionary from /fixtures/{id} or /livescores/now
+        """
+
+        if self.localteam_id:
+            return
+        self.localteam_id = fixture["localteam_id"]
+        self.visitorteam_id = fixture["visitorteam_id"]
+        self.cache.put(f"fixture:{self.game_id}", {"localteam_id": self.localteam_id, "visitorteam_id": self.visitorteam_id})
+
+
+    def remember_time(self, fixture):
+        """
+        Saves the match minute and time status of this observer's fixture
+
+        fixture: fixture dictionary from /fixtures/{id} or /livescores/now
+        """
+        self.minute = (fixture.get("time") or {}).get("minute")
+        self.status = (fixture.get("time") or {}).get("status")
+
+
+    def status_is_live(self, response):
+        """
+        Checks the time status of a /fixtures/{id} response
+
+        response: decoded json response
+
+        @return: True if game is live, False otherwise
+        """
+
         if response["data"]["time"]["status"]:
             if response["data"]["time"]["status"] == "LIVE" or response["data"]["time"]["status"] == "HT":
                 return True
@@ -73,13 +167,44 @@ class Observer:
         for i in range(45):
             if self.game_is_live():
                 print(f"{self.game_id} is now reported to be live, continues...")
+                self.fetch_team_info()
                 return True
-            time.sleep(20)
+            self.sleep(20)
 
-        error_notificator.post_message(f'*{self.game_id}:* Game never reported to be live in its first 15 mins, thread terminating')
+        self.error_notificator.post_message(f'*{self.game_id}:* Game never reported to be live in its first 15 mins, thread terminating')
         return False
 
 
+    def promote(self, fixture):
+        """
+        Takes over a fixture a Status_watcher saw go live, instead of wait_for_game_to_start
+
+        fixture: fixture dictionary from /fixtures/multi
+        """
+        self.record("fixture", {"data": fixture})
+        self.remember_fixture(fixture)
+        self.remember_time(fixture)
+        self.fetch_team_info()
+
+
+    def fetch_team_info(self):
+        """
+        Looks up the teams once the fixture is live, instead of on the first tick.
+        A slow or degraded API leaves them unknown, they are looked up again on the next poll
+
+        @return: True if the teams are known
+        """
+        if not self.localteam_info:
+            try:
+                localteam_info = self.fetch_team_from_id(str(self.localteam_id))
+                visitorteam_info = self.fetch_team_from_id(str(self.visitorteam_id))
+            except Sportmonks_error as e:
+                self.report_failure(e.result)
+                return False
+            self.localteam_info, self.visitorteam_info = localteam_info, visitorteam_info
+        return True
+
+
     def fetch_team_from_id(self, team_id):
         """
         Fetches the name and country of team id passed as argument
@@ -87,52 +212,105 @@ class Observer:
         @return: team name, country
         """
 
+        # Team names and countries almost never change, serve them from the cache when possible
+        team = self.cache.get(f"team:{team_id}")
+        if team:
+            self.record("team", {"team_id": str(team_id), "team": team})
+            return tuple(team)
+
         try:
             # test request to see if any answer arrives
-            raw_response = requests.get(url=f"https://soccer.sportmonks.com/api/v2.0/teams/{team_id}", params={"api_token": self.api_token, "include":"country", "tz":str(self.timezone)})
+            raw_response = self.client.get(f"/teams/{team_id}", params={"include":"country", "tz":str(self.timezone)}, priority=PRIORITY_METADATA)
+        except Sportmonks_error:
+            raise # a slow or degraded API, see fetch_team_info
         except:
-            error_notificator.post_message(f'*{self.game_id} Exception:* Connection to soccer API could not be established')
+            self.error_notificator.post_message(f'*{self.game_id} Exception:* Connection to soccer API could not be established')
             raise Exception("Connection could not be established, URL likely wrong")
-        response = raw_response.json()
+
+        team = self.parse_team(raw_response.json())
+        self.cache.put(f"team:{team_id}", team)
+        self.record("team", {"team_id": str(team_id), "team": team})
+        return team
+
+
+    def parse_team(self, response):
+        """
+        Picks the name and country out of a /teams/{id} response
+
+        response: decoded json response
+
+        @return: team name, country
+        """
 
         # Return teamname, country
         return response["data"]["name"], response["data"]["country"]["data"]["name"]
 
 
+    def fetch_fixture_from_livescores(self):
+        """
+        Fetches /livescores/now without a shared poller and picks out this observer's match
+
+        @return: the fixture dictionary, None if it can't be found
+        """
+
+        params = {"tz": str(self.timezone), "include": "stats"}
+        raw_response = self.client.get("/livescores/now", params=params, priority=PRIORITY_STATS)
+
+        # Decode only this observer's match out of every live match
+        try:
+            return extract_fixtures(raw_response.content, [self.game_id]).get(str(self.game_id))
+        except Exception as e:
+            self.error_notificator.post_message(f'*{self.game_id} Exception:* {e}')
+            raise
+
     def fetch_current_data(self):
         """
-        Fetches all relevant match data using requests, and builds a
+        Fetches all relevant match data using the sportmonks client, and builds a
         dictionary object suitable for evaluation/comparison
 
-        @return: dictionary of the match data
+        @return: dictionary of the match data, None if the API did not answer in time
         """
 
-        # Get livescores
-        params = {"api_token": self.api_token, "tz": str(self.timezone), "include": "stats"}
-        raw_response = requests.get(url="https://soccer.sportmonks.com/api/v2.0/livescores/now", params=params)
-        response = raw_response.json()
-        if "error" in response:
-            error_notificator.post_message(f'*{self.game_id} Exception:* {response["error"]["message"]}')
-            raise Exception(response["error"]["message"])
-
-        # Filter out irrelevant matches
-        correct_match = None
-        for i in response['data']:
-            if str(i['id']) == str(self.game_id):
-                correct_match = i
-                break
+        # Get livescores, shared with every other observer if a poller is available. A slow or degraded API skips this poll
+        try:
+            if self.poller:
+                correct_match = self.poller.get_fixture(self.game_id)
+            else:
+                correct_match = self.fetch_fixture_from_livescores()
+        except Sportmonks_error as e:
+            self.report_failure(e.result)
+            return None
+        except Exception as e:
+            if self.poller:
+                self.error_notificator.post_message(f'*{self.game_id} Exception:* {e}')
+            raise
 
         # Throw error if this observer's match cant be found
         if not correct_match:
-            error_notificator.post_message(f"*{self.game_id} Exception:* Correct match could not be found in [...]/livescores/now ")
+            self.error_notificator.post_message(f"*{self.game_id} Exception:* Correct match could not be found in [...]/livescores/now ")
             raise Exception(f"Correct match could not be found in [...]/livescores/now for match {self.game_id}")
+        self.record("livescores", correct_match)
 
-        # If not already saved, save the team names and countries
+        # If not already saved, save the team names and countries, the poll is skipped until they are known
         if not self.localteam_info:
-            self.localteam_id = correct_match["localteam_id"]
-            self.visitorteam_id = correct_match["visitorteam_id"]
-            self.localteam_info = self.fetch_team_from_id(str(self.localteam_id))
-            self.visitorteam_info = self.fetch_team_from_id(str(self.visitorteam_id))
+            self.remember_fixture(correct_match)
+            if not self.fetch_team_info():
+                return None
+
+        return self.build_stats(correct_match)
+
+
+    def build_stats(self, correct_match):
+        """
+        Builds the stats dictionary of a livescores fixture, keyed by 'localteam' and 'visitorteam'
+
+        correct_match: this observer's fixture from /livescores/now
+
+        @return: dictionary of the match data
+        """
+
+        # Save the match minute, used to key the history and schedule the polls
+        self.remember_time(correct_match)
 
         # Save stats for the local team and visitor team
         stats = {}
@@ -158,41 +336,57 @@ class Observer:
         """
         Fetches the relevant odds for evaluate_situation() to be able to do its job
 
-        @return: list of odds dictionarys
+        @return: list of bet365 asian handicap Odds_line objects, None if the API did not answer in time
         """
 
-        # Request all odds of inplay matches
-        params = {"api_token": self.api_token, "tz":str(self.timezone)}
-        raw_response = requests.get(url=f"https://soccer.sportmonks.com/api/v2.0/odds/inplay/fixture/{self.game_id}", params=params)
-        response = raw_response.json()
+        # Request all odds of inplay matches, hedged when slower than usual
+        params = {"tz":str(self.timezone)}
+        result = self.client.fetch(f"/odds/inplay/fixture/{self.game_id}", params=params, priority=PRIORITY_LIVE_ODDS, hedge=True)
+        if result.degraded:
+            self.report_failure(result)
+            return None
+
+        # Parsed by the pool's worker processes if available, the decoded response is only needed to record it
+        if self.parse_pool and not self.recorder:
+            self.odds_book = Odds_book.from_records(self.parse_pool.parse(odds_records, result.content))
+            return self.pick_odds()
+        response = result.json()
+        self.record("odds", response)
+        return self.extract_odds(response)
+
+
+    def extract_odds(self, response):
+        """
+        Picks the bet365 asian handicap odds out of an /odds/inplay/fixture/{id} response
+
+        response: decoded json response
+
+        @return: list of bet365 asian handicap Odds_line objects
+        """
+
+        # Parse every market and bookmaker once, strategies can compare bookmakers through self.odds_book
+        self.odds_book = Odds_book(response)
+        return self.pick_odds()
+
 
-        # Filter out other odd types
-        asian_handicap_object = None
-        for i in response['data']:
-            if "asian handicap" in str(i['name']).lower() and not "half" in str(i['name']).lower():
-                asian_handicap_object = i
-                break
+    def pick_odds(self):
+        """
+        Picks the bet365 asian handicap odds out of self.odds_book
+
+        @return: list of bet365 asian handicap Odds_line objects
+        """
 
         # Crash if asian handicaps can't be found
-        if not asian_handicap_object:
-            error_notificator.post_message(f"*{self.game_id} Exception:* No asian handicap odds can be found for match {self.game_id}")
+        if not self.odds_book.asian_handicap_market:
+            self.error_notificator.post_message(f"*{self.game_id} Exception:* No asian handicap odds can be found for match {self.game_id}")
             raise Exception(f"No asian handicap odds can be found for match {self.game_id}")
 
-        # Filter out other bookmakers
-        b365_asian_odds_object = None
-        for i in asian_handicap_object['bookmaker']['data']:
-            if str(i['name']) == "bet365":
-                b365_asian_odds_object = i
-                break
-
         # Crash if odds can't be found
-        if not b365_asian_odds_object:
-            error_notificator.post_message(f"*{self.game_id} Exception:* No bet information could be found originating from bet365 for match {self.game_id}")
+        list_of_odds = self.odds_book.lines_for(self.odds_book.asian_handicap_market, BET365)
+        if not list_of_odds:
+            self.error_notificator.post_message(f"*{self.game_id} Exception:* No bet information could be found originating from bet365 for match {self.game_id}")
             raise Exception(f"No bet information could be found originating from bet365 for match {self.game_id}")
 
-        # Extract list of odds dictionaries
-        list_of_odds = b365_asian_odds_object['odds']['data']
-
         return list_of_odds
 
 
@@ -204,7 +398,21 @@ class Observer:
         Fill this function with your evaluation criteria, I don't want to reveal my strategy
 
         stats: dictionary containing the stats for 'localteam' and 'visitorteam'
-        odds: list of odds objects
+        odds: list of bet365 asian handicap Odds_line objects, every other market and
+              bookmaker of the latest response is available through self.odds_book
+
+        The lines that moved since the previous poll are in self.odds_changes, ex: the biggest drop in price
+              min(delta for previous, line, delta in self.odds_changes.changed if delta is not None)
+        evaluate_situation is not called when neither the stats nor the odds changed
+
+        Earlier ticks are kept in self.history, ex: dangerous attacks per minute over the last 10 minutes
+              self.history.stats.rate("localteam_dangerous_attacks", 10)
+        and the drift of an odds line over the last 5 minutes
+              self.history.odds_drift("1", -0.5, 5)
+
+        What a team usually has by this minute is in self.baselines, without any request, ex:
+              self.baselines.expected(self.localteam_id, "dangerous_attacks", self.minute)
+        nan when the team has no baseline
 
         @return: dictionary of the evaluation results
         """
@@ -249,7 +457,13 @@ class Observer:
                 }
 
 
-        the asian handicap odds-objects in the list 'odds' look like this:
+        the asian handicap Odds_line objects in the list 'odds' are parsed from
+        sportmonks odds objects, with numeric values:
+                odds[0].label == "1", odds[0].handicap == -3.0, odds[0].value == 1.98,
+                odds[0].probability == 0.5051, odds[0].winning == True, odds[0].stop == False,
+                odds[0].last_update == 1596382090.103929 (unix timestamp, UTC)
+
+        parsed from:
                 {
                   "label": "1",
                   "value": "1.98",
@@ -279,37 +493,157 @@ class Observer:
         return None
 
 
+    def report_failure(self, result):
+        """
+        Reports a request that got no usable response, the poll is skipped and the observer carries on.
+        Nothing is posted while the circuit is open, the failures that opened it were already posted
+
+        result: Api_result of the request
+        """
+        print(f"{self.game_id} skipped this poll: {result}")
+        if result.error != CIRCUIT_OPEN_ERROR:
+            self.error_notificator.post_message(f'*{self.game_id} Exception:* Sportmonks did not answer in time, {result}')
+
+
+    def record(self, kind, payload):
+        """
+        Writes a response this observer has seen to its recorder, does nothing without one
+
+        kind: "fixture", "team", "livescores" or "odds"
+        payload: decoded json response
+        """
+        if self.recorder:
+            self.recorder.record(kind, payload)
+
+
+    def now(self):
+        """
+        @return: current time, overridden when replaying recorded matches
+        """
+        return datetime.now()
+
+
+    def sleep(self, seconds):
+        """
+        Sleeps for a number of seconds, overridden when replaying recorded matches
+        """
+        time.sleep(seconds)
+
+
+    def tick(self):
+        """
+        Fetches the current stats and odds once, keeps them in the match history,
+        evaluates them and posts in slack if a bet should be placed
+
+        @return: True if a bet notification was posted
+        """
+
+        started = time.perf_counter()
+        # evaluate the situation, keeping the snapshot in the match history ...
+        stats = self.fetch_current_data()
+        odds = self.fetch_current_odds() if stats is not None else None
+        if stats is None or odds is None:
+            TICK_SECONDS.observe(time.perf_counter() - started, mode="threads")
+            return False
+        self.history.record(self.minute, stats, odds)
+        self.scheduler.record_odds(odds)
+        if not self.has_changed(stats, odds):
+            TICK_SECONDS.observe(time.perf_counter() - started, mode="threads")
+            return False
+        evaluate_started = time.perf_counter()
+        result = self.evaluate_situation(stats, odds)
+        EVALUATE_SECONDS.observe(time.perf_counter() - evaluate_started, mode="threads")
+        # ... and if a bet should be placed; post in slack
+        if result["bet"]:
+            record_signal(odds)
+            self.notificator.post_message(f'A bet should be placed now, on *{result["onTeam"]}*, {self.fetch_team_from_id(result["onTeam"])} on one of these good bets: *{result["odds"]}*')
+        TICK_SECONDS.observe(time.perf_counter() - started, mode="threads")
+        return result["bet"]
+
+
+    def has_changed(self, stats, odds):
+        """
+        Diffs the odds against the previous poll, keeping the moved lines in self.odds_changes
+
+        @return: False if neither the stats nor the odds changed, so there is nothing new to evaluate
+        """
+        self.odds_changes = self.odds_tracker.update(odds)
+        stats_changed = stats != self.last_stats
+        self.last_stats = stats
+        return stats_changed or bool(self.odds_changes)
+
+
+    def snapshot(self):
+        """
+        @return: json serializable state of the observer, enough to resume the observation after a restart
+        """
+        return {
+            "game_id": self.game_id,
+            "localteam_id": self.localteam_id, "visitorteam_id": self.visitorteam_id,
+            "localteam_info": self.localteam_info, "visitorteam_info": self.visitorteam_info,
+            "minute": self.minute, "status": self.status,
+            "match_ends": self.match_ends.timestamp() if self.match_ends else None,
+            "muted_until": self.muted_until.timestamp() if self.muted_until else None,
+            "poll_interval": self.scheduler.interval, "last_update": self.scheduler.last_update,
+            "history": self.history.snapshot(),
+        }
+
+
+    def restore(self, snapshot):
+        """
+        Resumes from a snapshot, observe() then polls right away instead of waiting for the game to start
+        """
+        self.localteam_id, self.visitorteam_id = snapshot["localteam_id"], snapshot["visitorteam_id"]
+        self.localteam_info = tuple(snapshot["localteam_info"]) if snapshot["localteam_info"] else None
+        self.visitorteam_info = tuple(snapshot["visitorteam_info"]) if snapshot["visitorteam_info"] else None
+        self.minute, self.status = snapshot["minute"], snapshot["status"]
+        self.match_ends = datetime.fromtimestamp(snapshot["match_ends"]) if snapshot["match_ends"] else None
+        self.muted_until = datetime.fromtimestamp(snapshot["muted_until"]) if snapshot["muted_until"] else None
+        self.scheduler.interval, self.scheduler.last_update = snapshot["poll_interval"], snapshot["last_update"]
+        self.history.restore(snapshot["history"])
+        self.restored = True
+
+
+    def time_to_next_poll(self, muted_until):
+        """
+        Asks the scheduler how long to wait before the next poll, from the match phase,
+        the recent odds movement, the mute state and the remaining API budget
+
+        muted_until: datetime until which no bet notifications are sent
+
+        @return: Number of seconds to wait
+        """
+        muted_for = max((muted_until - self.now()).total_seconds(), 0)
+        return self.scheduler.next_interval(self.minute, self.status, muted_for)
+
+
     def observe(self):
         """
         Observes the game specified by self.game_id, evaluating stats,
         sending notifications on Slack if a bet should be placed
         """
-        global error_notificator
-
-        # Create messaging bots and establish their connections
-        notificator = Slack_message_bot(self.slacktoken, self.notifications_channel)
-        notificator.connect()
-        error_notificator = Slack_message_bot(self.slacktoken, self.errors_channel)
-        error_notificator.connect()
-
-        # calculate time to stop observing
-        match_ends = datetime.now() + timedelta(minutes=90)
-        muted_until = datetime.now()
-
-        # Sleep for 10 minutes
-        for i in range(10):
-            time.sleep(60)
-
-        # Event loop
-        while datetime.now() < match_ends:
-            time.sleep(30)
-            # Iff not muted...
-            if (datetime.now() - muted_until).days == 0:
-                # ... evaluate the situation ...
-                result = self.evaluate_situation(self.fetch_current_data(), self.fetch_current_odds())
-                # ... and if a bet should be placed; post in slack and update mute timestamp
-                if result["bet"]:
-                    notificator.post_message(f'A bet should be placed now, on *{result["onTeam"]}*, {self.fetch_team_from_id(result["onTeam"])} on one of these good bets: *{result["odds"]}*')
-                    muted_until = datetime.now()+timedelta(minutes=15)
 
+        # calculate time to stop observing, unless resuming after a restart
+        if not self.match_ends:
+            self.match_ends = self.now() + timedelta(minutes=90)
+            self.muted_until = self.now()
+
+        # Event loop, the first wait lasts until the opening 10 minutes have been played, a resumed observer polls right away
+        ACTIVE_OBSERVERS.inc()
+        try:
+            while self.now() < self.match_ends:
+                if not self.restored:
+                    self.sleep(min(self.time_to_next_poll(self.muted_until), max((self.match_ends - self.now()).total_seconds(), 0)))
+                self.restored = False
+                # Iff not muted, evaluate the situation and update mute timestamp after a bet notification
+                if (self.now() - self.muted_until).days == 0:
+                    if self.tick():
+                        self.muted_until = self.now()+timedelta(minutes=15)
+        finally:
+            ACTIVE_OBSERVERS.dec()
+
+        if self.poller:
+            self.poller.unwatch(self.game_id)
+        if self.recorder:
+            self.recorder.close()
         print(f"Match {self.game_id} ended")
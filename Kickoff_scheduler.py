@@ -0,0 +1,154 @@
+from datetime import datetime, timedelta, timezone
+from zoneinfo import ZoneInfo
+import heapq
+from Sportmonks_connector import PRIORITY_METADATA
+
+# Time statuses of fixtures that will not be played as scheduled
+NOT_PLAYED = ("FT", "AET", "FT_PEN", "POSTP", "CANCL", "ABAN", "SUSP", "AWARDED", "DELETED", "WO")
+
+class Kickoff_scheduler:
+
+    def __init__(self, client, timezone_name="Europe/Stockholm", refresh_interval=900, running_minutes=80):
+        """
+        Keeps the kickoffs of the coming fixtures in a heap, so the app can sleep until the next one
+        and start every fixture kicking off at the same time at once
+
+        client: Sportmonks_client used to fetch the fixtures
+        timezone_name: IANA timezone of the schedule, ex: "Europe/Stockholm", daylight saving time included
+        refresh_interval: Number of seconds between two refreshes of the schedule, to pick up late changes
+        running_minutes: Number of minutes after its kickoff a fixture is still started, ex: after a restart
+        """
+        self.client = client
+        self.timezone_name = timezone_name
+        self.zone = ZoneInfo(timezone_name)
+        self.refresh_interval = timedelta(seconds=refresh_interval)
+        self.running = timedelta(minutes=running_minutes)
+        self.kickoffs = {} # fixture id -> kickoff, the current schedule
+        self.heap = [] # (kickoff, fixture id), entries no longer matching self.kickoffs are skipped
+        self.started = set() # fixture ids handed out by due()
+        self.next_refresh = None
+
+
+    def now(self):
+        return datetime.now(self.zone)
+
+
+    def kickoff_time(self, fixture):
+        """
+        @return: timezone aware kickoff of a fixture, in self.zone
+        """
+        starting_at = fixture["time"]["starting_at"]
+        if starting_at.get("timestamp"):
+            return datetime.fromtimestamp(int(starting_at["timestamp"]), timezone.utc).astimezone(self.zone)
+        moment = datetime.strptime(starting_at["date_time"], "%Y-%m-%d %H:%M:%S")
+        return moment.replace(tzinfo=ZoneInfo(starting_at.get("timezone") or self.timezone_name)).astimezone(self.zone)
+
+
+    def fetch_day(self, day):
+        """
+        @return: list of the fixtures of one day in self.zone
+        """
+        raw_response = self.client.get(f"/fixtures/date/{day}", params={"tz": self.timezone_name}, priority=PRIORITY_METADATA)
+        response = raw_response.json()
+
+        try:
+            return response['data']
+        except:
+            raise Exception("The sportmonks response did not contain any data, double check your account subscription status and the information provided in credentials.json")
+
+
+    def refresh(self):
+        """
+        Fetches the fixtures of today and tomorrow and merges them into the schedule: new fixtures are
+        added, moved kickoffs are rescheduled and postponed or cancelled fixtures are dropped.
+        Tomorrow is included so that fixtures kicking off just after midnight are never missed
+
+        @return: list of (kickoff, fixture id) tuples that were added or moved
+        """
+        now = self.now()
+        self.next_refresh = now + self.refresh_interval # also after a failed refresh, to retry later
+        changes = []
+        seen = set()
+        for day in (now.date(), (now + timedelta(days=1)).date()):
+            for fixture in self.fetch_day(day):
+                game_id = fixture["id"]
+                seen.add(game_id)
+                if fixture["time"].get("status") in NOT_PLAYED:
+                    self.kickoffs.pop(game_id, None)
+                    continue
+                kickoff = self.kickoff_time(fixture)
+                if self.kickoffs.get(game_id) != kickoff and game_id not in self.started:
+                    self.kickoffs[game_id] = kickoff
+                    heapq.heappush(self.heap, (kickoff, game_id))
+                    changes.append((kickoff, game_id))
+
+        # Forget fixtures that were removed from the schedule or are over
+        for game_id, kickoff in list(self.kickoffs.items()):
+            if kickoff + self.running < now or (game_id not in seen and kickoff > now):
+                del self.kickoffs[game_id]
+        self.started &= set(self.kickoffs)
+        return sorted(changes)
+
+
+    def due(self):
+        """
+        Pops every fixture whose kickoff has passed, including those that kicked off
+        less than self.running ago, ex: when the app starts during a match
+
+        @return: list of fixture ids to start observing
+        """
+        now = self.now()
+        games = []
+        while self.heap and self.heap[0][0] <= now:
+            kickoff, game_id = heapq.heappop(self.heap)
+            if self.kickoffs.get(game_id) != kickoff or game_id in self.started:
+                continue # rescheduled, dropped or already started
+            if kickoff + self.running >= now:
+                self.started.add(game_id)
+                games.append(game_id)
+        return games
+
+
+    def refresh_due(self):
+        return self.next_refresh is None or self.now() >= self.next_refresh
+
+
+    def seconds_until_next(self):
+        """
+        @return: Number of seconds until the next kickoff or refresh, whichever comes first
+        """
+        now = self.now()
+        while self.heap and (self.kickoffs.get(self.heap[0][1]) != self.heap[0][0] or self.heap[0][1] in self.started):
+            heapq.heappop(self.heap)
+        wakes = [self.heap[0][0]] if self.heap else []
+        wakes += [self.next_refresh] if self.next_refresh else []
+        return max((min(wakes, default=now) - now).total_seconds(), 0)
+
+
+    def upcoming(self, day=None):
+        """
+        day: date to list, None for today
+
+        @return: sorted list of (kickoff, fixture id) tuples not started yet
+        """
+        day = day or self.now().date()
+        return sorted((kickoff, game_id) for game_id, kickoff in self.kickoffs.items() if kickoff.date() == day and game_id not in self.started)
+
+
+    def snapshot(self):
+        """
+        @return: json serializable schedule, kickoffs as unix timestamps, see restore()
+        """
+        return {"kickoffs": {str(game_id): kickoff.timestamp() for game_id, kickoff in self.kickoffs.items()}, "started": list(self.started)}
+
+
+    def restore(self, snapshot):
+        """
+        Reloads a schedule saved before a restart, fixtures already started are not handed out by due() again.
+        The next refresh() still fetches the schedule, the snapshot only bridges the time until then
+        """
+        for game_id, timestamp in snapshot["kickoffs"].items():
+            kickoff = datetime.fromtimestamp(timestamp, timezone.utc).astimezone(self.zone)
+            self.kickoffs[int(game_id)] = kickoff
+            heapq.heappush(self.heap, (kickoff, int(game_id)))
+        self.started |= set(snapshot["started"])
@@ -0,0 +1,71 @@
+import json
+import re
+
+# orjson decodes whole responses several times faster than the json module, it is optional
+try:
+    import orjson
+    loads = orjson.loads
+except ImportError:
+    orjson = None
+    loads = json.loads
+
+# Every fixture object in a sportmonks response starts with its id, matched on the raw bytes
+FIXTURE_START = re.compile(rb'\{\s*"id"\s*:\s*(\d+)')
+ERROR_START = re.compile(rb'^\s*\{\s*"error"')
+decoder = json.JSONDecoder()
+
+
+def decode_object(body, start, ends):
+    """
+    Decodes the json object starting at an offset of the raw bytes, with loads, without decoding the rest.
+    Its end is unknown, so the slices up to each following object start are tried in turn:
+    only a slice holding the whole object decodes, a shorter one stops inside a nested object
+
+    body: raw bytes of the response
+    start: offset of the object's opening brace
+    ends: offsets of the object starts after it, in order
+
+    @return: the decoded object
+    """
+    for end in ends:
+        try:
+            return loads(body[start:end].rstrip(b", \t\r\n"))
+        except ValueError:
+            continue
+    return decoder.raw_decode(body[start:].decode())[0] # the last fixture, followed by the end of the response
+
+
+def extract_fixtures(body, game_ids):
+    """
+    Decodes only the requested fixtures of a /livescores/now response, instead of every live match worldwide.
+    Fixture starts are found with a regular expression over the raw bytes, and each requested
+    fixture is decoded on its own from there, the rest of the response is never decoded.
+    A requested fixture the expression missed is looked up in the fully decoded response
+
+    body: raw bytes of the response
+    game_ids: ids of the fixtures to extract
+
+    @return: dictionary of the found fixtures, keyed by fixture id as a string
+    """
+
+    # Errors are small, decode them fully for the usual error handling
+    body = body.encode() if isinstance(body, str) else body
+    if ERROR_START.match(body):
+        raise Exception(loads(body)["error"]["message"])
+
+    wanted = {str(game_id) for game_id in game_ids}
+    starts = [(start.start(), start.group(1).decode()) for start in FIXTURE_START.finditer(body)]
+    fixtures = {}
+    for i, (offset, game_id) in enumerate(starts):
+        if game_id not in wanted or game_id in fixtures:
+            continue
+        fixture = decode_object(body, offset, [end for end, _ in starts[i + 1:]])
+        # Nested objects may have an id too, fixtures are the ones with teams
+        if "localteam_id" in fixture:
+            fixtures[game_id] = fixture
+
+    if len(fixtures) < len(wanted):
+        for fixture in loads(body).get("data") or []:
+            if str(fixture.get("id")) in wanted:
+                fixtures.setdefault(str(fixture["id"]), fixture)
+    return fixtures
@@ -0,0 +1,208 @@
+import asyncio
+import threading
+import time
+from Sportmonks_connector import Sportmonks_error, PRIORITY_STATS
+from Livescores_parser import extract_fixtures, loads
+
+class Livescores_poller:
+
+    def __init__(self, client, timezone="CEST", interval=30, parse_pool=None):
+        """
+        Constructor
+
+        client: Sportmonks_client shared by the process
+        timezone: Timezone passed to the API with every request
+        interval: Number of seconds a fetched livescores response is considered fresh
+        parse_pool: Parse_pool extracting the watched fixtures in a worker process, None to extract them here
+        """
+        self.client = client
+        self.parse_pool = parse_pool
+        self.timezone = timezone
+        self.interval = interval
+        self.fixtures = {}
+        self.watched = set() # ids of the fixtures observers asked for, the only ones decoded
+        self.body = None # raw bytes of the last response, newly watched fixtures are extracted from it
+        self.fetched_at = None
+        self.failure = None # (time.monotonic(), Sportmonks_error) of the last failed refresh
+        self.lock = threading.Lock()
+
+
+    def refresh(self):
+        """
+        Fetches /livescores/now once and rebuilds the fixture id -> fixture index
+
+        @return: dictionary of the live fixtures, keyed by fixture id
+        """
+
+        # Raises Sportmonks_error if the API is degraded, for the observers to skip this poll
+        params = {"tz": str(self.timezone), "include": "stats"}
+        raw_response = self.client.get("/livescores/now", params=params, priority=PRIORITY_STATS)
+        return self.build_index_from_bytes(raw_response.content)
+
+
+    def build_index_from_bytes(self, body):
+        """
+        Indexes the watched fixtures of a raw response, decoding only those.
+        Every fixture is decoded while nothing is watched
+
+        body: raw bytes of /livescores/now
+
+        @return: dictionary of the live fixtures, keyed by fixture id
+        """
+
+        if not self.watched:
+            self.build_index(loads(body))
+        elif self.parse_pool:
+            self.fixtures = self.parse_pool.parse(extract_fixtures, body, list(self.watched))
+        else:
+            self.fixtures = extract_fixtures(body, self.watched)
+        self.body = body
+        self.fetched_at = time.monotonic()
+        return self.fixtures
+
+
+    def build_index(self, response):
+        """
+        Indexes every live match once, so each observer can look up its own in O(1)
+
+        response: decoded json response of /livescores/now
+
+        @return: dictionary of the live fixtures, keyed by fixture id
+        """
+
+        if "error" in response:
+            raise Exception(response["error"]["message"])
+
+        self.fixtures = {str(i['id']): i for i in response['data']}
+        self.fetched_at = time.monotonic()
+        return self.fixtures
+
+
+    def is_stale(self):
+        """
+        @return: True if the current index is older than self.interval
+        """
+        return self.fetched_at is None or time.monotonic() - self.fetched_at >= self.interval
+
+
+    def raise_shared_failure(self, asked_at):
+        """
+        Raises the failure of a refresh that was in flight when the observer asked, so the observers
+        waiting on it skip this poll together instead of each retrying with a full deadline.
+        Must be called holding self.lock
+        """
+        if self.failure and self.failure[0] >= asked_at:
+            raise self.failure[1]
+
+
+    def watch(self, game_id, asked_at):
+        """
+        Includes a fixture in the index, extracted from the last response if it is in it.
+        Only a fixture missing from a response fetched before it was asked for is fetched again,
+        so observers starting together share the refresh of the first one.
+        Must be called holding self.lock
+
+        game_id: id of the fixture
+        asked_at: time.monotonic() when the observer asked for the fixture, before waiting for the lock
+        """
+        if str(game_id) in self.watched:
+            return
+        self.watched.add(str(game_id))
+        if str(game_id) not in self.fixtures and self.body is not None:
+            self.fixtures.update(extract_fixtures(self.body, [game_id]))
+        if str(game_id) not in self.fixtures and (self.fetched_at is None or self.fetched_at < asked_at):
+            self.fetched_at = None
+
+
+    def unwatch(self, game_id):
+        """
+        Stops decoding a fixture, ex: once its observer is done
+        """
+        with self.lock:
+            self.watched.discard(str(game_id))
+            self.fixtures.pop(str(game_id), None)
+
+
+    def get_fixture(self, game_id):
+        """
+        Returns the livescores entry of a single fixture. The first caller after
+        the index goes stale refreshes it, every other observer reuses that response, or its failure
+
+        game_id: id of the fixture
+
+        @return: the fixture dictionary, None if the fixture is not live
+        """
+
+        asked_at = time.monotonic()
+        with self.lock:
+            self.watch(game_id, asked_at)
+            if self.is_stale():
+                self.raise_shared_failure(asked_at)
+                try:
+                    self.refresh()
+                except Sportmonks_error as e:
+                    self.failure = (time.monotonic(), e)
+                    raise
+            return self.fixtures.get(str(game_id))
+
+
+class Async_livescores_poller(Livescores_poller):
+
+    def __init__(self, client, timezone="CEST", interval=30, parse_pool=None):
+        """
+        Constructor
+
+        client: Async_sportmonks_client shared by the event loop
+        timezone: Timezone passed to the API with every request
+        interval: Number of seconds a fetched livescores response is considered fresh
+        parse_pool: Parse_pool extracting the watched fixtures off the event loop, None to extract them on it
+        """
+        super().__init__(client, timezone, interval, parse_pool)
+        self.lock = asyncio.Lock()
+
+
+    async def refresh(self):
+        """
+        Fetches /livescores/now once without blocking the event loop
+
+        @return: dictionary of the live fixtures, keyed by fixture id
+        """
+
+        params = {"tz": str(self.timezone), "include": "stats"}
+        body = await self.client.get_bytes("/livescores/now", params, PRIORITY_STATS)
+        if self.parse_pool and self.watched:
+            self.fixtures = await self.parse_pool.parse_async(extract_fixtures, body, list(self.watched))
+            self.body = body
+            self.fetched_at = time.monotonic()
+            return self.fixtures
+        return self.build_index_from_bytes(body)
+
+
+    def unwatch(self, game_id):
+        """
+        Stops decoding a fixture, the event loop needs no lock
+        """
+        self.watched.discard(str(game_id))
+        self.fixtures.pop(str(game_id), None)
+
+
+    async def get_fixture(self, game_id):
+        """
+        Returns the livescores entry of a single fixture, see Livescores_poller.get_fixture
+
+        game_id: id of the fixture
+
+        @return: the fixture dictionary, None if the fixture is not live
+        """
+
+        asked_at = time.monotonic()
+        async with self.lock:
+            self.watch(game_id, asked_at)
+            if self.is_stale():
+                self.raise_shared_failure(asked_at)
+                try:
+                    await self.refresh()
+                except Sportmonks_error as e:
+                    self.failure = (time.monotonic(), e)
+                    raise
+            return self.fixtures.get(str(game_id))
@@ -0,0 +1,228 @@
+from collections import OrderedDict
+import numpy as np
+
+# Stats fields recorded for each team, as (column suffix, path in the stats dictionary)
+STATS_FIELDS = (
+    ("shots_ongoal", ("shots", "ongoal")),
+    ("shots_offgoal", ("shots", "offgoal")),
+    ("attacks", ("attacks", "attacks")),
+    ("dangerous_attacks", ("attacks", "dangerous_attacks")),
+    ("possessiontime", ("possessiontime",)),
+)
+STATS_COLUMNS = tuple(f"{team}_{name}" for team in ("localteam", "visitorteam") for name, path in STATS_FIELDS)
+ODDS_COLUMNS = ("value", "probability")
+
+# Minutes of one observation, 90 minutes from kickoff plus margin
+OBSERVED_MINUTES = 100
+
+
+def history_capacity(min_interval):
+    """
+    @return: Number of snapshots covering OBSERVED_MINUTES when polling every min_interval seconds
+    """
+    return int(OBSERVED_MINUTES * 60 / min_interval)
+
+
+def team_values(team_stats):
+    """
+    Picks the STATS_FIELDS out of the stats of one team
+
+    team_stats: stats dictionary of one team, ex: stats['localteam']
+
+    @return: list of floats in the order of STATS_FIELDS, nan for missing values
+    """
+    row = []
+    for name, path in STATS_FIELDS:
+        value = team_stats
+        for key in path:
+            value = value.get(key) if isinstance(value, dict) else None
+        row.append(np.nan if value is None else value)
+    return row
+
+
+class Ring_buffer:
+
+    def __init__(self, capacity, fields):
+        """
+        Fixed capacity time series, the oldest snapshot is overwritten once full
+
+        capacity: Number of snapshots kept
+        fields: tuple of column names
+        """
+        self.capacity = capacity
+        self.fields = tuple(fields)
+        self.columns = {name: i for i, name in enumerate(self.fields)}
+        self.minutes = np.full(capacity, np.nan)
+        self.values = np.full((capacity, len(self.fields)), np.nan)
+        self.head = 0 # index the next snapshot is written to
+        self.size = 0
+
+
+    def append(self, minute, row):
+        """
+        Adds a snapshot
+
+        minute: match minute of the snapshot
+        row: sequence of floats in the order of self.fields, nan for missing values
+        """
+        self.minutes[self.head] = minute
+        self.values[self.head] = row
+        self.head = (self.head + 1) % self.capacity
+        self.size = min(self.size + 1, self.capacity)
+
+
+    def order(self):
+        """
+        @return: array of buffer indices from the oldest to the newest snapshot
+        """
+        return np.arange(self.head - self.size, self.head) % self.capacity
+
+
+    def window(self, field, minutes=None):
+        """
+        Selects the snapshots of the last minutes of play
+
+        field: column name
+        minutes: length of the window, None for every snapshot kept
+
+        @return: array of minutes, array of values, oldest first
+        """
+        order = self.order()
+        times = self.minutes[order]
+        values = self.values[order, self.columns[field]]
+        if minutes is not None and self.size:
+            mask = times >= times[-1] - minutes
+            times, values = times[mask], values[mask]
+        return times, values
+
+
+    def latest(self, field):
+        """
+        @return: newest value of a column, nan if empty
+        """
+        if not self.size:
+            return np.nan
+        return self.values[(self.head - 1) % self.capacity, self.columns[field]]
+
+
+    def delta(self, field, minutes):
+        """
+        @return: change of a column over the last minutes of play, nan if unknown
+        """
+        times, values = self.window(field, minutes)
+        values = values[~np.isnan(values)]
+        if values.size < 2:
+            return np.nan
+        return values[-1] - values[0]
+
+
+    def rate(self, field, minutes):
+        """
+        @return: change of a column per minute over the last minutes of play, ex: dangerous attacks per minute
+        """
+        times, values = self.window(field, minutes)
+        known = ~np.isnan(values)
+        times, values = times[known], values[known]
+        if values.size < 2 or times[-1] == times[0]:
+            return np.nan
+        return (values[-1] - values[0]) / (times[-1] - times[0])
+
+
+    def snapshot(self):
+        """
+        @return: json serializable copy of the snapshots, oldest first
+        """
+        order = self.order()
+        return {"minutes": self.minutes[order].tolist(), "values": self.values[order].tolist()}
+
+
+    def restore(self, snapshot):
+        """
+        Appends the snapshots saved by snapshot()
+        """
+        for minute, row in zip(snapshot["minutes"], snapshot["values"]):
+            self.append(minute, row)
+
+
+    def rolling_mean(self, field, minutes):
+        """
+        @return: mean of a column over the last minutes of play, nan if unknown
+        """
+        times, values = self.window(field, minutes)
+        if not np.any(~np.isnan(values)):
+            return np.nan
+        return np.nanmean(values)
+
+
+class Match_history:
+
+    def __init__(self, capacity=600, max_lines=64):
+        """
+        Bounded history of the stats and odds snapshots of one match, 600 snapshots
+        cover the whole observation at the shortest poll interval of 10 seconds, see history_capacity
+
+        capacity: Number of snapshots kept per series
+        max_lines: Number of odds lines tracked, the least recently updated are dropped beyond it
+        """
+        self.capacity = capacity
+        self.max_lines = max_lines
+        self.stats = Ring_buffer(capacity, STATS_COLUMNS)
+        self.odds = OrderedDict() # (label, handicap) -> Ring_buffer, least recently updated first
+
+
+    def record(self, minute, stats, odds):
+        """
+        Adds the snapshot of one tick
+
+        minute: match minute
+        stats: dictionary containing the stats for 'localteam' and 'visitorteam'
+        odds: list of Odds_line objects
+        """
+
+        if minute is None:
+            return
+
+        self.stats.append(minute, team_values(stats.get("localteam")) + team_values(stats.get("visitorteam")))
+
+        for line in odds:
+            key = (line.label, line.handicap)
+            if key not in self.odds:
+                self.odds[key] = Ring_buffer(self.capacity, ODDS_COLUMNS)
+                if len(self.odds) > self.max_lines:
+                    self.odds.popitem(last=False)
+            self.odds.move_to_end(key)
+            self.odds[key].append(minute, (np.nan if line.value is None else line.value, np.nan if line.probability is None else line.probability))
+
+
+    def snapshot(self):
+        """
+        @return: json serializable copy of the history, see restore()
+        """
+        return {"stats": self.stats.snapshot(), "odds": [[label, handicap, series.snapshot()] for (label, handicap), series in self.odds.items()]}
+
+
+    def restore(self, snapshot):
+        """
+        Refills the history from a snapshot, ex: after a restart
+        """
+        self.stats.restore(snapshot["stats"])
+        for label, handicap, series in snapshot["odds"]:
+            self.odds[(label, handicap)] = Ring_buffer(self.capacity, ODDS_COLUMNS)
+            self.odds[(label, handicap)].restore(series)
+
+
+    def line(self, label, handicap):
+        """
+        @return: Ring_buffer of an odds line, None if it was never recorded
+        """
+        return self.odds.get((str(label), handicap))
+
+
+    def odds_drift(self, label, handicap, minutes):
+        """
+        @return: change of an odds line's price over the last minutes of play, nan if unknown
+        """
+        series = self.line(label, handicap)
+        if series is None:
+            return np.nan
+        return series.delta("value", minutes)
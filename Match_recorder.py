@@ -0,0 +1,69 @@
+from datetime import datetime
+import gzip
+import json
+import os
+import threading
+import time
+
+class Match_recorder:
+
+    def __init__(self, path, game_id):
+        """
+        Writes every response an observer sees to a gzip compressed json lines file,
+        to be replayed by Backtest.py
+
+        path: File to append the recording to
+        game_id: id of the recorded fixture
+        """
+        self.path = path
+        self.file = gzip.open(path, "at", encoding="utf-8")
+        self.lock = threading.Lock()
+        self.record("meta", {"game_id": str(game_id)})
+
+
+    @staticmethod
+    def for_fixture(directory, game_id):
+        """
+        Creates a recorder writing to <directory>/<game_id>-<date>.jsonl.gz
+
+        @return: Match_recorder
+        """
+        os.makedirs(directory, exist_ok=True)
+        return Match_recorder(os.path.join(directory, f"{game_id}-{datetime.now().date()}.jsonl.gz"), game_id)
+
+
+    def record(self, kind, payload):
+        """
+        Appends a response to the recording
+
+        kind: "meta", "fixture", "team", "livescores" or "odds"
+        payload: decoded json response
+        """
+        line = json.dumps({"t": time.time(), "kind": kind, "data": payload})
+        with self.lock:
+            if not self.file.closed:
+                self.file.write(line + "\n")
+
+
+    def close(self):
+        """
+        Flushes and closes the recording
+        """
+        with self.lock:
+            self.file.close()
+
+
+def read_recording(path):
+    """
+    Reads a recording written by Match_recorder, stopping at a truncated last line
+
+    @return: list of records, dictionaries with the keys "t", "kind" and "data"
+    """
+    records = []
+    try:
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            for line in f:
+                records.append(json.loads(line))
+    except (EOFError, json.JSONDecodeError):
+        print(f"Recording {path} is truncated, replaying the complete records")
+    return records
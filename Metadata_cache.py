@@ -0,0 +1,105 @@
+from collections import OrderedDict
+import json
+import os
+import threading
+import time
+
+class Metadata_cache:
+
+    def __init__(self, path=None, ttl=7*24*3600, max_entries=5000):
+        """
+        Constructor, one cache is meant to be shared by the whole process
+
+        path: File the cache is persisted to, None to keep it in memory only
+        ttl: Number of seconds an entry stays valid
+        max_entries: Number of entries kept before the least recently used are evicted
+        """
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.entries = OrderedDict() # key -> (expires_at, value), least recently used first
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        self.load()
+
+
+    def load(self):
+        """
+        Restores the entries persisted to self.path, skipping the expired ones
+        """
+
+        if not self.path or not os.path.exists(self.path):
+            return
+
+        try:
+            data = json.load(open(self.path,))
+        except:
+            print(f"Metadata cache {self.path} could not be read, starting cold")
+            return
+
+        now = time.time()
+        for key, expires_at, value in data:
+            if expires_at > now:
+                self.entries[key] = (expires_at, value)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+
+    def save(self):
+        """
+        Persists the entries to self.path, must be called holding self.lock
+        """
+
+        if not self.path:
+            return
+
+        temp_path = f"{self.path}.{os.getpid()}.tmp" # processes of a sharded deployment may share the file
+        with open(temp_path, "w") as f:
+            json.dump([[key, expires_at, value] for key, (expires_at, value) in self.entries.items()], f)
+        os.replace(temp_path, self.path)
+
+
+    def get(self, key):
+        """
+        Looks up a cached value
+
+        key: String key, ex: "team:314"
+
+        @return: the cached value, None if missing or expired
+        """
+
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or entry[0] <= time.time():
+                if entry is not None:
+                    del self.entries[key]
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+
+    def put(self, key, value):
+        """
+        Stores a json serializable value and persists the cache
+
+        key: String key, ex: "team:314"
+        value: value to cache
+        """
+
+        with self.lock:
+            self.entries[key] = (time.time() + self.ttl, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+            self.save()
+
+
+    def stats(self):
+        """
+        @return: dictionary of the hit and miss counters and the number of entries
+        """
+        with self.lock:
+            return {"hits": self.hits, "misses": self.misses, "entries": len(self.entries)}
@@ -0,0 +1,228 @@
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+import re
+import threading
+import time
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+SIZE_BUCKETS = (1e3, 1e4, 1e5, 1e6, 1e7)
+LATENCY_BUCKETS = (1, 2.5, 5, 10, 15, 20, 30, 45, 60, 120, 300)
+
+
+def endpoint_name(path):
+    """
+    Collapses the ids of an API path, so every fixture shares one label, ex: "/odds/inplay/fixture/{id}"
+    """
+    return re.sub(r"/\d[\d,\-]*", "/{id}", path.split("?")[0])
+
+
+def format_labels(names, values):
+    if not names:
+        return ""
+    return "{" + ",".join(f'{name}="{value}"' for name, value in zip(names, values)) + "}"
+
+
+class Metric:
+
+    def __init__(self, name, help, labels=()):
+        """
+        name: Prometheus metric name
+        help: One line description
+        labels: Names of the labels the metric is split by
+        """
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self.values = {} # label values -> value
+        self.lock = threading.Lock()
+
+
+    def key(self, labels):
+        return tuple(str(labels.get(name, "")) for name in self.label_names)
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self.key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+
+    def render(self):
+        with self.lock:
+            return [f"{self.name}{format_labels(self.label_names, key)} {value}" for key, value in self.values.items()]
+
+
+class Gauge(Counter):
+    type = "gauge"
+
+    def set(self, value, **labels):
+        with self.lock:
+            self.values[self.key(labels)] = value
+
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=DURATION_BUCKETS):
+        """
+        buckets: Upper bounds of the buckets, +Inf is added
+        """
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+
+
+    def observe(self, value, **labels):
+        key = self.key(labels)
+        with self.lock:
+            counts, total = self.values.get(key, ([0] * (len(self.buckets) + 1), 0.0))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            counts[-1] += 1
+            self.values[key] = (counts, total + value)
+
+
+    def render(self):
+        lines = []
+        with self.lock:
+            for key, (counts, total) in self.values.items():
+                for bound, count in zip(self.buckets + ("+Inf",), counts):
+                    lines.append(f"{self.name}_bucket{format_labels(self.label_names + ('le',), key + (bound,))} {count}")
+                lines.append(f"{self.name}_sum{format_labels(self.label_names, key)} {total}")
+                lines.append(f"{self.name}_count{format_labels(self.label_names, key)} {counts[-1]}")
+        return lines
+
+
+class Registry:
+
+    def __init__(self):
+        """
+        In-process collection of metrics, rendered in the Prometheus text format
+        """
+        self.metrics = {}
+        self.lock = threading.Lock()
+
+
+    def register(self, metric):
+        with self.lock:
+            return self.metrics.setdefault(metric.name, metric)
+
+
+    def counter(self, name, help, labels=()):
+        return self.register(Counter(name, help, labels))
+
+
+    def gauge(self, name, help, labels=()):
+        return self.register(Gauge(name, help, labels))
+
+
+    def histogram(self, name, help, labels=(), buckets=DURATION_BUCKETS):
+        return self.register(Histogram(name, help, labels, buckets))
+
+
+    def render(self):
+        """
+        @return: String of every metric in the Prometheus text exposition format
+        """
+        lines = []
+        with self.lock:
+            metrics = list(self.metrics.values())
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            lines += metric.render()
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+API_REQUEST_SECONDS = REGISTRY.histogram("sportmonks_request_duration_seconds", "Duration of sportmonks requests, waiting for the budget excluded", ("endpoint",))
+API_RESPONSE_BYTES = REGISTRY.histogram("sportmonks_response_bytes", "Size of sportmonks responses", ("endpoint",), SIZE_BUCKETS)
+API_RESPONSES = REGISTRY.counter("sportmonks_responses_total", "Sportmonks responses by HTTP status", ("endpoint", "status"))
+TICK_SECONDS = REGISTRY.histogram("observer_tick_duration_seconds", "Duration of one observer poll, fetching and evaluating", ("mode",))
+EVALUATE_SECONDS = REGISTRY.histogram("evaluate_duration_seconds", "Duration of evaluate_situation, or of one vectorised evaluation", ("mode",))
+SLACK_POST_SECONDS = REGISTRY.histogram("slack_post_duration_seconds", "Duration of one chat.postMessage request to slack")
+SLACK_DELIVERY_SECONDS = REGISTRY.histogram("slack_delivery_seconds", "Time from queuing a slack message in the dispatcher to its delivery, retries included")
+SLACK_QUEUE_DEPTH = REGISTRY.gauge("slack_queue_depth", "Slack messages waiting for delivery")
+ACTIVE_OBSERVERS = REGISTRY.gauge("active_observers", "Fixtures currently observed")
+API_ERRORS = REGISTRY.counter("sportmonks_errors_total", "Sportmonks requests without a usable response, by error", ("endpoint", "error"))
+API_HEDGES = REGISTRY.counter("sportmonks_hedged_requests_total", "Second requests sent because the first had not answered by its p95", ("endpoint",))
+CIRCUIT_OPEN = REGISTRY.gauge("sportmonks_circuit_open", "1 while the circuit breaker holds back the requests to a degraded API")
+PARSE_SECONDS = REGISTRY.histogram("parse_duration_seconds", "Time from handing a response to the parse pool to getting its records back, queueing included", ("function",))
+SIGNAL_LATENCY_SECONDS = REGISTRY.histogram("signal_latency_seconds", "Time from the last_update of the odds to queuing the bet notification", buckets=LATENCY_BUCKETS)
+
+
+def record_response(path, status, size, seconds):
+    """
+    Records one sportmonks response
+
+    path: endpoint relative to the base url, ex: "/odds/inplay/fixture/18157"
+    status: HTTP status code
+    size: Number of bytes of the body
+    seconds: Duration of the request
+    """
+    endpoint = endpoint_name(path)
+    API_REQUEST_SECONDS.observe(seconds, endpoint=endpoint)
+    API_RESPONSE_BYTES.observe(size, endpoint=endpoint)
+    API_RESPONSES.inc(endpoint=endpoint, status=status)
+
+
+def record_signal(odds):
+    """
+    Records the time from the latest update of the odds a bet notification reacts to until now
+
+    odds: list of Odds_line objects the bet was decided on
+    """
+    last_update = max([line.last_update or 0 for line in odds] + [0])
+    if last_update:
+        SIGNAL_LATENCY_SECONDS.observe(max(time.time() - last_update, 0))
+
+
+class Metrics_server:
+
+    def __init__(self, registry=REGISTRY, host="0.0.0.0", port=5000):
+        """
+        Serves the registry on http://host:port/metrics for Prometheus to scrape
+        """
+        self.registry = registry
+        self.server = ThreadingHTTPServer((host, port), self.handler_class())
+        self.server.daemon_threads = True
+
+
+    def handler_class(self):
+        registry = self.registry
+
+        class Handler(BaseHTTPRequestHandler):
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_response(404)
+                    self.end_headers()
+                    return
+                payload = registry.render().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+        return Handler
+
+
+    def start(self):
+        """
+        Serves in a background thread
+
+        @return: self
+        """
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
@@ -0,0 +1,282 @@
+from datetime import datetime, timezone
+from Livescores_parser import loads
+
+ASIAN_HANDICAP = "asian handicap"
+BET365 = "bet365"
+
+
+def to_float(value):
+    """
+    Converts a sportmonks string value like "1.98" or "50.51%" to a float
+
+    @return: float, None if the value is missing or not numeric
+    """
+    if value is None:
+        return None
+    try:
+        return float(str(value).rstrip("%"))
+    except ValueError:
+        return None
+
+
+def handicap_key(handicap):
+    """
+    Normalises a handicap so "-3.0", "-3" and -3 index the same line
+
+    @return: float, or the stripped string for split handicaps like "0, -0.5"
+    """
+    number = to_float(handicap)
+    if number is None and handicap is not None:
+        return str(handicap).replace(" ", "")
+    return number
+
+
+def parse_last_update(last_update):
+    """
+    Converts a sportmonks last_update object to a unix timestamp
+
+    @return: float, None if missing
+    """
+    if not last_update or not last_update.get("date"):
+        return None
+    try:
+        moment = datetime.strptime(last_update["date"], "%Y-%m-%d %H:%M:%S.%f")
+    except ValueError:
+        moment = datetime.strptime(last_update["date"], "%Y-%m-%d %H:%M:%S")
+    return moment.replace(tzinfo=timezone.utc).timestamp()
+
+
+class Odds_line:
+    """
+    One parsed odds line, with numbers stored as floats instead of strings
+    """
+
+    __slots__ = ("market", "bookmaker", "label", "handicap", "value", "probability", "winning", "stop", "last_update")
+
+    def __init__(self, market, bookmaker, odds):
+        """
+        Constructor
+
+        market: lowercase market name, ex: "asian handicap"
+        bookmaker: lowercase bookmaker name, ex: "bet365"
+        odds: odds dictionary from the sportmonks response
+        """
+        self.market = market
+        self.bookmaker = bookmaker
+        self.label = str(odds.get("label"))
+        self.handicap = handicap_key(odds.get("handicap"))
+        self.value = to_float(odds.get("value"))
+        probability = to_float(odds.get("probability"))
+        self.probability = probability / 100 if probability is not None else None
+        self.winning = odds.get("winning")
+        self.stop = bool(odds.get("stop"))
+        self.last_update = parse_last_update(odds.get("last_update"))
+
+
+    @classmethod
+    def from_record(cls, record):
+        """
+        Rebuilds a line from record(), without parsing anything again
+        """
+        line = cls.__new__(cls)
+        line.market, line.bookmaker, line.label, line.handicap, line.value, line.probability, line.winning, line.stop, line.last_update = record
+        return line
+
+
+    def record(self):
+        """
+        @return: tuple of the parsed fields in the order of __slots__, compact to send between processes
+        """
+        return (self.market, self.bookmaker, self.label, self.handicap, self.value, self.probability, self.winning, self.stop, self.last_update)
+
+
+    def __repr__(self):
+        return f"Odds_line({self.bookmaker} {self.market} {self.label} {self.handicap}: {self.value})"
+
+
+class Odds_book:
+
+    def __init__(self, response):
+        """
+        Parses an /odds/inplay/fixture/{id} response once into lines indexed by
+        (market, bookmaker, handicap, label)
+
+        response: decoded json response
+        """
+        self.lines = {}
+        self.by_market = {} # market -> bookmaker -> list of lines
+        self.asian_handicap_market = None
+
+        for market_object in response.get("data") or []:
+            market = str(market_object.get("name")).lower()
+            for bookmaker_object in market_object["bookmaker"]["data"]:
+                bookmaker = str(bookmaker_object["name"]).lower()
+                for odds in bookmaker_object["odds"]["data"]:
+                    self.add(Odds_line(market, bookmaker, odds))
+
+
+    @classmethod
+    def from_records(cls, records):
+        """
+        Builds a book from the records of odds_records(), ex: parsed by a Parse_pool worker
+
+        records: list of Odds_line.record() tuples
+        """
+        book = cls({})
+        for record in records:
+            book.add(Odds_line.from_record(record))
+        return book
+
+
+    def add(self, line):
+        """
+        Indexes one line, lines are added in the order of the response
+        """
+
+        # Full time asian handicap, same rule as the original bet365 filter
+        if self.asian_handicap_market is None and ASIAN_HANDICAP in line.market and not "half" in line.market:
+            self.asian_handicap_market = line.market
+
+        self.lines[(line.market, line.bookmaker, line.handicap, line.label)] = line
+        self.by_market.setdefault(line.market, {}).setdefault(line.bookmaker, []).append(line)
+
+
+    def lines_in_order(self):
+        """
+        @return: every line in the order of the response
+        """
+        return [line for bookmakers in self.by_market.values() for lines in bookmakers.values() for line in lines]
+
+
+    def get(self, market, bookmaker, handicap, label):
+        """
+        Looks up a single line
+
+        @return: Odds_line, None if it isn't offered
+        """
+        return self.lines.get((market.lower(), bookmaker.lower(), handicap_key(handicap), str(label)))
+
+
+    def lines_for(self, market, bookmaker):
+        """
+        @return: list of every Odds_line a bookmaker offers in a market
+        """
+        if market is None:
+            return []
+        return self.by_market.get(market.lower(), {}).get(bookmaker.lower(), [])
+
+
+    def bookmakers(self, market):
+        """
+        @return: list of the bookmakers offering a market
+        """
+        if market is None:
+            return []
+        return list(self.by_market.get(market.lower(), {}))
+
+
+    def best(self, market, handicap, label):
+        """
+        Finds the highest price offered for a line across all bookmakers
+
+        @return: Odds_line, None if no bookmaker offers the line
+        """
+        best_line = None
+        for bookmaker in self.bookmakers(market):
+            line = self.get(market, bookmaker, handicap, label)
+            if line and line.value is not None and (best_line is None or line.value > best_line.value):
+                best_line = line
+        return best_line
+
+
+    def average(self, market, handicap, label):
+        """
+        Averages the price of a line across all bookmakers offering it
+
+        @return: float, None if no bookmaker offers the line
+        """
+        values = [line.value for line in (self.get(market, bookmaker, handicap, label) for bookmaker in self.bookmakers(market)) if line and line.value is not None]
+        if not values:
+            return None
+        return sum(values) / len(values)
+
+
+def odds_records(body):
+    """
+    Decodes an /odds/inplay/fixture/{id} response and parses every line, meant to run in a Parse_pool worker
+
+    body: raw bytes of the response
+
+    @return: list of Odds_line.record() tuples, see Odds_book.from_records
+    """
+    return [line.record() for line in Odds_book(loads(body)).lines_in_order()]
+
+
+class Odds_diff:
+    """
+    The lines that moved between two polls of the same fixture
+    """
+
+    __slots__ = ("added", "removed", "changed")
+
+    def __init__(self, added=None, removed=None, changed=None):
+        """
+        added: list of Odds_line objects offered since this poll
+        removed: list of Odds_line objects no longer offered
+        changed: list of (previous Odds_line, current Odds_line, change in value) tuples
+        """
+        self.added = added or []
+        self.removed = removed or []
+        self.changed = changed or []
+
+
+    def __bool__(self):
+        return bool(self.added or self.removed or self.changed)
+
+
+    def __repr__(self):
+        return f"Odds_diff(added={self.added}, removed={self.removed}, changed={[(line, delta) for previous, line, delta in self.changed]})"
+
+
+class Odds_tracker:
+
+    def __init__(self):
+        """
+        Keeps the previous odds of one fixture, keyed by (label, handicap), to tell which lines moved
+        """
+        self.lines = {} # (label, handicap) -> Odds_line of the previous poll
+        self.last_update = None
+
+
+    def update(self, odds):
+        """
+        Compares the lines of a poll with the previous poll and keeps them for the next one.
+        A line whose last_update did not advance is taken as unchanged without comparing its values
+
+        odds: list of Odds_line objects, ex: the bet365 asian handicap lines
+
+        @return: Odds_diff, falsy when nothing moved
+        """
+        current = {(line.label, line.handicap): line for line in odds}
+        last_update = max([line.last_update or 0 for line in odds] + [0]) or None
+
+        # Nothing was updated and the same lines are offered: skip the per line comparison
+        if last_update is not None and last_update == self.last_update and current.keys() == self.lines.keys():
+            self.lines = current
+            return Odds_diff()
+
+        diff = Odds_diff()
+        for key, line in current.items():
+            previous = self.lines.get(key)
+            if previous is None:
+                diff.added.append(line)
+            elif line.last_update and previous.last_update and line.last_update <= previous.last_update:
+                continue
+            elif line.value != previous.value or line.stop != previous.stop:
+                delta = line.value - previous.value if line.value is not None and previous.value is not None else None
+                diff.changed.append((previous, line, delta))
+        diff.removed = [line for key, line in self.lines.items() if key not in current]
+
+        self.lines = current
+        self.last_update = last_update
+        return diff
@@ -0,0 +1,82 @@
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import asyncio
+import multiprocessing
+import os
+import threading
+import time
+from Metrics import PARSE_SECONDS
+
+
+def default_workers():
+    """
+    @return: Number of worker processes leaving a core to the observers, at most 4, 0 on a single core
+    """
+    return min(max((os.cpu_count() or 1) - 1, 0), 4)
+
+
+class Parse_pool:
+
+    def __init__(self, workers, max_pending=None):
+        """
+        Decodes the responses in worker processes, so the observer threads only wait on I/O and
+        rebuild objects from compact records instead of holding the GIL while decoding.
+        Fetching, parsing and evaluating then overlap across observers, on as many cores as workers
+
+        workers: Number of worker processes
+        max_pending: Number of responses queued or being parsed at once, callers wait beyond it, 4 per worker if None
+        """
+        self.workers = workers
+        self.max_pending = max_pending or 4 * workers
+        # spawned, not forked: the app forks the pool while its threads hold locks
+        self.executor = ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("spawn"))
+        self.slots = threading.BoundedSemaphore(self.max_pending)
+        self.async_slots = None # created on the event loop by parse_async
+        self.broken = False
+
+
+    def parse(self, function, *args):
+        """
+        Runs a module level function in a worker process, in this thread if the pool broke
+
+        function: parsing function, ex: Odds_book.odds_records
+        args: its arguments, ex: the raw bytes of a response
+
+        @return: the function's result, its exceptions are raised here
+        """
+        if self.broken:
+            return function(*args)
+        started = time.perf_counter()
+        with self.slots:
+            try:
+                result = self.executor.submit(function, *args).result()
+            except BrokenProcessPool:
+                print("Parse pool broke, parsing in the observers from now on")
+                self.broken = True
+                return function(*args)
+        PARSE_SECONDS.observe(time.perf_counter() - started, function=function.__name__)
+        return result
+
+
+    async def parse_async(self, function, *args):
+        """
+        Runs a module level function in a worker process without blocking the event loop, see parse()
+        """
+        if self.broken:
+            return function(*args)
+        if self.async_slots is None:
+            self.async_slots = asyncio.Semaphore(self.max_pending)
+        started = time.perf_counter()
+        async with self.async_slots:
+            try:
+                result = await asyncio.wrap_future(self.executor.submit(function, *args))
+            except BrokenProcessPool:
+                print("Parse pool broke, parsing in the observers from now on")
+                self.broken = True
+                return function(*args)
+        PARSE_SECONDS.observe(time.perf_counter() - started, function=function.__name__)
+        return result
+
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,70 @@
+import time
+
+class Poll_scheduler:
+
+    def __init__(self, bucket=None, min_interval=10, base_interval=30, max_interval=120, halftime_interval=120, opening_minutes=10):
+        """
+        Decides how long one fixture's observer waits before its next poll
+
+        bucket: Token_bucket of the process, polls are spaced out when its budget runs low
+        min_interval: Shortest interval, about the rate at which the API refreshes inplay odds
+        base_interval: Interval before anything is known about the odds movement
+        max_interval: Longest interval for a quiet fixture
+        halftime_interval: Interval while the fixture reports HT
+        opening_minutes: Match minutes that are not evaluated, like the original 10 minute sleep
+        """
+        self.bucket = bucket
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.halftime_interval = halftime_interval
+        self.opening_minutes = opening_minutes
+        self.interval = base_interval
+        self.last_update = None
+        self.last_change = None
+
+
+    def record_odds(self, odds):
+        """
+        Adapts the interval to the odds of the latest poll: halves it when a line moved
+        since the previous poll and lets it grow by a quarter when nothing did
+
+        odds: list of Odds_line objects
+        """
+        last_update = max([line.last_update or 0 for line in odds] + [0]) or None
+        if last_update is None or self.last_update is None:
+            self.last_update = last_update
+            return
+
+        if last_update > self.last_update:
+            self.interval = max(self.min_interval, self.interval / 2)
+            self.last_change = time.time()
+        else:
+            self.interval = min(self.max_interval, self.interval * 1.25)
+        self.last_update = last_update
+
+
+    def next_interval(self, minute=None, status=None, muted_for=0):
+        """
+        minute: current match minute, None if unknown
+        status: current time status of the fixture, ex: "LIVE" or "HT"
+        muted_for: Number of seconds the observer stays muted
+
+        @return: Number of seconds to wait before the next poll
+        """
+
+        # Nothing is evaluated while muted or before the opening minutes have been played
+        if muted_for > 0:
+            return max(muted_for, self.min_interval)
+        if minute is None:
+            return self.opening_minutes * 60
+        if status != "HT" and minute < self.opening_minutes:
+            return max((self.opening_minutes - minute) * 60, self.min_interval)
+
+        interval = self.halftime_interval if status == "HT" else self.interval
+
+        # Spread polls out when the hourly budget runs low, to keep it for the moving fixtures
+        if self.bucket:
+            remaining = self.bucket.remaining()
+            if remaining < 0.5:
+                interval = min(interval * 0.5 / max(remaining, 0.05), 10 * self.max_interval)
+        return interval
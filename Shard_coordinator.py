@@ -0,0 +1,167 @@
+from contextlib import contextmanager
+import fcntl
+import hashlib
+import json
+import os
+import socket
+import threading
+import time
+
+
+def default_worker_id():
+    """
+    @return: id unique to this process on this host, ex: "raspberrypi-1234"
+    """
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+def weight(worker_id, game_id):
+    """
+    Rendezvous hash of a fixture for a worker, the live worker with the highest weight owns the fixture.
+    When a worker dies only its own fixtures move, each to the remaining worker it weighs highest for
+    """
+    return int.from_bytes(hashlib.sha1(f"{worker_id}:{game_id}".encode()).digest()[:8], "big")
+
+
+class Shard_coordinator:
+
+    def __init__(self, directory, on_claim, worker_id=None, heartbeat_interval=10, worker_timeout=45, lease_minutes=110):
+        """
+        Splits the fixtures between every worker sharing a directory, ex: processes on one host
+        or containers mounting the same volume. Workers announce themselves with heartbeats and
+        hold a lease on every fixture they observe, the fixtures of a worker that stops
+        heartbeating are claimed by the others
+
+        directory: Directory shared by the workers, holding coordinator.json and its lock file
+        on_claim: Called with the fixture id of every fixture this worker takes on
+        worker_id: Unique name of this worker, the hostname and pid if None
+        heartbeat_interval: Number of seconds between two heartbeats
+        worker_timeout: Number of seconds without a heartbeat before a worker is considered dead
+        lease_minutes: Number of minutes after its kickoff a fixture is held, covering the observation
+        """
+        os.makedirs(directory, exist_ok=True)
+        self.path = os.path.join(directory, "coordinator.json")
+        self.lock_path = self.path + ".lock"
+        self.on_claim = on_claim
+        self.worker_id = worker_id or default_worker_id()
+        self.heartbeat_interval = heartbeat_interval
+        self.worker_timeout = worker_timeout
+        self.lease = lease_minutes * 60
+        self.candidates = {} # fixture id -> time until which it may still be claimed
+        self.lock = threading.Lock()
+
+
+    @contextmanager
+    def state(self):
+        """
+        Holds the lock file while the shared state is read and modified, then writes it back
+
+        @return: dictionary of "workers" (worker id -> last heartbeat) and "leases" (fixture id -> {"worker", "expires"})
+        """
+        with self.lock, open(self.lock_path, "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                with open(self.path) as f:
+                    state = json.load(f)
+            except (OSError, ValueError):
+                state = {"workers": {}, "leases": {}}
+            yield state
+            temp_path = self.path + ".tmp"
+            with open(temp_path, "w") as f:
+                json.dump(state, f)
+            os.replace(temp_path, self.path)
+
+
+    def live_workers(self, state, now):
+        return [worker for worker, seen in state["workers"].items() if now - seen < self.worker_timeout]
+
+
+    def owner(self, state, game_id, now):
+        """
+        @return: id of the live worker a fixture hashes to
+        """
+        workers = self.live_workers(state, now) or [self.worker_id]
+        return max(workers, key=lambda worker: weight(worker, game_id))
+
+
+    def offer(self, game_id):
+        """
+        Offers a fixture that kicked off, every worker is offered every fixture.
+        It is claimed now if it hashes to this worker, or later if its owner dies
+
+        @return: True if this worker claimed the fixture
+        """
+        with self.lock:
+            self.candidates[str(game_id)] = time.time() + self.lease
+        return game_id in self.claim([game_id])
+
+
+    def claim(self, game_ids):
+        """
+        Takes the lease of every fixture that hashes to this worker and is not leased by a live worker
+
+        @return: list of the fixture ids claimed
+        """
+        claimed = []
+        now = time.time()
+        with self.state() as state:
+            state["workers"][self.worker_id] = now
+            live = set(self.live_workers(state, now))
+            for game_id in game_ids:
+                lease = state["leases"].get(str(game_id))
+                if lease and lease["worker"] in live and lease["expires"] > now:
+                    continue
+                if self.owner(state, game_id, now) != self.worker_id:
+                    continue
+                state["leases"][str(game_id)] = {"worker": self.worker_id, "expires": self.candidates.get(str(game_id), now + self.lease)}
+                claimed.append(game_id)
+        return claimed
+
+
+    def heartbeat(self):
+        """
+        Announces this worker, forgets expired leases and dead workers, and takes over
+        the fixtures of dead workers that hash to this worker
+
+        @return: list of the fixture ids taken over
+        """
+        now = time.time()
+        with self.lock:
+            for game_id in [g for g, until in self.candidates.items() if until < now]:
+                del self.candidates[game_id]
+            candidates = list(self.candidates)
+
+        with self.state() as state:
+            state["workers"][self.worker_id] = now
+            state["leases"] = {g: lease for g, lease in state["leases"].items() if lease["expires"] > now}
+            state["workers"] = {w: seen for w, seen in state["workers"].items() if now - seen < 10 * self.worker_timeout}
+            held = {g for g, lease in state["leases"].items() if lease["worker"] == self.worker_id}
+
+        # Claim the candidates not held by this worker, claim() skips those held by live workers
+        claimed = self.claim([game_id for game_id in candidates if game_id not in held])
+        for game_id in claimed:
+            print(f"{game_id} taken over by worker {self.worker_id}")
+            self.on_claim(int(game_id))
+        return claimed
+
+
+    def run(self):
+        """
+        Heartbeats every self.heartbeat_interval seconds, forever
+        """
+        while True:
+            try:
+                self.heartbeat()
+            except Exception as e:
+                print(f"Heartbeat failed: {e}")
+            time.sleep(self.heartbeat_interval)
+
+
+    def stats(self):
+        """
+        @return: dictionary of the live workers and the number of fixtures each of them holds
+        """
+        now = time.time()
+        with self.state() as state:
+            live = self.live_workers(state, now)
+            return {worker: sum(1 for lease in state["leases"].values() if lease["worker"] == worker and lease["expires"] > now) for worker in live}
@@ -1,50 +1,313 @@
+from collections import deque
+import os
+import threading
+import time
 import slack
+from slack.errors import SlackApiError
+from Metrics import SLACK_POST_SECONDS, SLACK_DELIVERY_SECONDS, SLACK_QUEUE_DEPTH
+
+# Overridable to point the bot at a stand-in server, see Fake_services.py
+BASE_URL = os.environ.get("SLACK_BASE_URL", "https://www.slack.com/api/")
+
+# Slack errors that retrying the same message can't fix, the message is dropped at once
+PERMANENT_ERRORS = ("channel_not_found", "not_in_channel", "is_archived", "invalid_auth", "not_authed",
+                    "account_inactive", "token_revoked", "missing_scope", "msg_too_long", "no_text")
 
 class Slack_message_bot:
 
-    def __init__(self, token, channel):
+    def __init__(self, token, channel, base_url=BASE_URL, dispatcher=None, coalesce=False):
         """
         Constructor
 
         token: String of slack API token for authentication
         channel: The name of the channel in which to post messages
+        base_url: Root of the slack web API
+        dispatcher: Slack_dispatcher delivering the messages in the background, None to post synchronously
+        coalesce: True to merge bursts of the same message into one, ex: for error channels
         """
         self.TOKEN = token
         self.CHANNEL = channel
+        self.BASE_URL = base_url
+        self.dispatcher = dispatcher
+        self.coalesce = coalesce
 
     def connect(self):
         """
         Establishes a connection to the slack client using self.token
-        Does nothing if channel is Null
+        Does nothing if channel is Null or messages go through a dispatcher
 
         @return: True if successful, False otherwise
         """
-        if self.CHANNEL == None:
+        if self.CHANNEL == None or self.dispatcher:
             return True
 
         try:
-            self.connection = slack.WebClient(token=self.TOKEN)
+            self.connection = slack.WebClient(token=self.TOKEN, base_url=self.BASE_URL)
         except:
             raise Exception("Connection to Slack could not be established, verify the provided slack token")
         return True
 
     def post_message(self, message):
         """
-        Posts message to the channel self.channel
+        Posts message to the channel self.channel, returns immediately if a dispatcher is used
         Does nothing if channel is Null
 
         message: String object of message to post
 
-        @return: True if successful post
+        @return: True if successful post, or successfully queued
         """
 
         if self.CHANNEL == None:
             return True
 
+        if self.dispatcher:
+            return self.dispatcher.submit(self.CHANNEL, message, self.coalesce)
+
+        started = time.perf_counter()
         try:
             self.connection.chat_postMessage(
                 channel=self.CHANNEL,
                 text = message)
         except:
             raise Exception("Message could not be posted, verify that the provided channel exists")
+        SLACK_POST_SECONDS.observe(time.perf_counter() - started)
         return True
+
+
+class Slack_dispatcher:
+
+    def __init__(self, token, base_url=BASE_URL, max_queue=1000, channel_interval=1.0, coalesce_window=60, max_retries=5, priority_channels=(), max_priority_queue=1000):
+        """
+        Delivers slack messages from a background thread through one shared client,
+        so posting never blocks or crashes an observer. Every channel has its own queue and
+        rate limit, so a busy or failing channel never holds up the messages of another
+
+        token: String of slack API token for authentication
+        base_url: Root of the slack web API
+        max_queue: Number of messages waiting in the other channels before new ones are dropped
+        channel_interval: Seconds between two messages in the same channel, slack allows about one per second
+        coalesce_window: Seconds during which a repeated coalescing message is counted instead of posted
+        max_retries: Number of attempts before a message is dropped
+        priority_channels: Channels delivered first whenever they are ready, ex: the bet notifications channel
+        max_priority_queue: Number of messages waiting in the priority channels, apart from max_queue so a flood of errors never drops them
+        """
+        self.connection = slack.WebClient(token=token, base_url=base_url)
+        self.max_queue = max_queue
+        self.max_priority_queue = max_priority_queue
+        self.channel_interval = channel_interval
+        self.coalesce_window = coalesce_window
+        self.max_retries = max_retries
+        self.priority_channels = set(priority_channels)
+        self.channels = {} # channel -> deque of queued entries
+        self.queued = 0 # entries waiting in self.channels
+        self.unfinished = 0 # entries queued or being delivered
+        self.pending = {} # (channel, message) -> queued entry, for coalescing messages
+        self.recently_sent = {} # (channel, message) -> time it was last delivered, until its coalesce window is over
+        self.repeats = {} # (channel, message) -> repeats held back since then, posted once the window is over
+        self.next_post = {} # channel -> earliest time of its next message
+        self.latencies = deque(maxlen=500)
+        self.counters = {"delivered": 0, "dropped": 0, "coalesced": 0, "retried": 0}
+        self.lock = threading.Lock()
+        self.ready = threading.Condition(self.lock) # notified whenever a message is queued
+        self.window_ends = None # time the first coalesce window is over
+        self.thread = None
+
+
+    def start(self):
+        """
+        Starts the background delivery thread
+
+        @return: self
+        """
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+        return self
+
+
+    def submit(self, channel, message, coalesce=False):
+        """
+        Queues a message, returning immediately
+
+        channel: The name of the channel in which to post the message
+        message: String object of message to post
+        coalesce: True to merge repeats of this message into one post
+
+        @return: True if queued or merged, False if dropped because the queue is full
+        """
+        key = (channel, message)
+        now = time.time()
+        with self.lock:
+            if coalesce and key in self.pending:
+                self.pending[key]["count"] += 1
+                self.counters["coalesced"] += 1
+                return True
+            if coalesce and now - self.recently_sent.get(key, 0) < self.coalesce_window:
+                self.repeats[key] = self.repeats.get(key, 0) + 1
+                self.counters["coalesced"] += 1
+                return True
+            return self.enqueue(channel, message, coalesce, 1, now)
+
+
+    def enqueue(self, channel, message, coalesce, count, now):
+        """
+        Adds a message to its channel's queue, unless the queue of its kind of channel is full.
+        Must be called holding self.lock
+
+        count: Number of times the message was submitted
+
+        @return: True if queued, False if dropped
+        """
+        priority_queued = sum(len(self.channels.get(c, ())) for c in self.priority_channels)
+        if channel in self.priority_channels:
+            full = priority_queued >= self.max_priority_queue
+        else:
+            full = self.queued - priority_queued >= self.max_queue
+        if full:
+            self.counters["dropped"] += 1
+            return False
+
+        entry = {"channel": channel, "message": message, "coalesce": coalesce, "count": count, "queued_at": now, "attempts": 0, "text": None}
+        self.channels.setdefault(channel, deque()).append(entry)
+        self.queued += 1
+        self.unfinished += 1
+        if coalesce:
+            self.pending[(channel, message)] = entry
+        SLACK_QUEUE_DEPTH.set(self.queued)
+        self.ready.notify()
+        return True
+
+
+    def expire(self, now):
+        """
+        Ends the coalesce windows that are over, forgetting their messages. The repeats held back
+        during a window are queued as one message instead of waiting for the message to come again.
+        Must be called holding self.lock
+        """
+        if self.window_ends is None or now < self.window_ends:
+            return
+        for key, sent_at in list(self.recently_sent.items()):
+            if now - sent_at >= self.coalesce_window:
+                del self.recently_sent[key]
+                count = self.repeats.pop(key, 0)
+                if count and key in self.pending:
+                    self.pending[key]["count"] += count # the message came again meanwhile
+                elif count:
+                    self.enqueue(key[0], key[1], True, count, now)
+        self.window_ends = min(self.recently_sent.values()) + self.coalesce_window if self.recently_sent else None
+
+
+    def next_entry(self):
+        """
+        Waits until a channel may post again and takes its oldest message.
+        The priority channels go first, then the channel whose oldest message has waited the longest.
+        Must be called holding self.lock
+
+        @return: queued entry
+        """
+        while True:
+            now = time.time()
+            self.expire(now)
+            waiting = [channel for channel, entries in self.channels.items() if entries]
+            ready = [channel for channel in waiting if self.next_post.get(channel, 0) <= now]
+            if ready:
+                channel = min(ready, key=lambda c: (c not in self.priority_channels, self.channels[c][0]["queued_at"]))
+                self.queued -= 1
+                SLACK_QUEUE_DEPTH.set(self.queued)
+                return self.channels[channel].popleft()
+            wakes = [self.next_post.get(channel, 0) for channel in waiting] + ([self.window_ends] if self.window_ends else [])
+            self.ready.wait(min(wakes) - now if wakes else None)
+
+
+    def run(self):
+        """
+        Delivers queued messages forever, respecting each channel's rate limit
+        """
+        while True:
+            with self.lock:
+                entry = self.next_entry()
+                key = (entry["channel"], entry["message"])
+                if entry["text"] is None:
+                    if entry["coalesce"]:
+                        self.pending.pop(key, None)
+                        entry["count"] += self.repeats.pop(key, 0)
+                    entry["text"] = entry["message"] if entry["count"] == 1 else f'{entry["message"]} _(repeated {entry["count"]} times)_'
+
+            retry_in = self.deliver(entry["channel"], entry["text"], entry["attempts"])
+            entry["attempts"] += 1
+
+            with self.lock:
+                if retry_in is None:
+                    self.next_post[entry["channel"]] = time.time() + self.channel_interval
+                    self.counters["delivered"] += 1
+                    self.latencies.append(time.time() - entry["queued_at"])
+                    SLACK_DELIVERY_SECONDS.observe(self.latencies[-1])
+                    if entry["coalesce"]:
+                        self.recently_sent[key] = time.time()
+                        ends = self.recently_sent[key] + self.coalesce_window
+                        self.window_ends = ends if self.window_ends is None else min(self.window_ends, ends)
+                elif retry_in >= 0 and entry["attempts"] < self.max_retries:
+                    # Retried first in its channel once the wait is over, the other channels carry on meanwhile
+                    self.next_post[entry["channel"]] = time.time() + retry_in
+                    self.channels[entry["channel"]].appendleft(entry)
+                    self.queued += 1
+                    self.counters["retried"] += 1
+                    continue
+                else:
+                    print(f'Message to {entry["channel"]} dropped after {entry["attempts"]} attempts: {entry["text"]}')
+                    self.next_post[entry["channel"]] = time.time() + self.channel_interval
+                    self.counters["dropped"] += 1
+                self.unfinished -= 1
+
+
+    def deliver(self, channel, text, attempt=0):
+        """
+        Posts one message once
+
+        attempt: Number of earlier attempts at this message
+
+        @return: None if delivered, else the number of seconds to wait before retrying: Retry-After
+        when throttled, exponential backoff otherwise, -1 for the errors retrying can't fix
+        """
+        started = time.perf_counter()
+        try:
+            self.connection.chat_postMessage(channel=channel, text=text)
+            SLACK_POST_SECONDS.observe(time.perf_counter() - started)
+            return None
+        except SlackApiError as e:
+            if e.response is not None and e.response.get("error") in PERMANENT_ERRORS:
+                print(f'Message to {channel} can never be posted: {e.response.get("error")}')
+                return -1
+            retry_after = e.response.headers.get("Retry-After") if e.response is not None and e.response.headers else None
+            if retry_after:
+                return float(retry_after)
+        except Exception:
+            pass
+        return 2 ** attempt
+
+
+    def flush(self, timeout=None):
+        """
+        Waits until every queued message has been handled
+
+        timeout: Maximum number of seconds to wait, None to wait forever
+
+        @return: True if the queue is empty
+        """
+        deadline = None if timeout is None else time.time() + timeout
+        while self.unfinished:
+            if deadline is not None and time.time() > deadline:
+                return False
+            time.sleep(0.05)
+        return True
+
+
+    def stats(self):
+        """
+        @return: dictionary of the queue depth, delivery counters and delivery latency in ms
+        """
+        with self.lock:
+            latencies = sorted(self.latencies)
+            stats = dict(self.counters, queue_depth=self.queued)
+        stats["latency_ms_mean"] = 1000 * sum(latencies) / len(latencies) if latencies else None
+        stats["latency_ms_p95"] = 1000 * latencies[int(0.95 * (len(latencies) - 1))] if latencies else None
+        return stats
@@ -0,0 +1,592 @@
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as Future_timeout, wait, FIRST_COMPLETED
+import asyncio
+import fcntl
+import json
+import os
+import threading
+import time
+import aiohttp
+import requests
+from requests.adapters import HTTPAdapter
+from Metrics import record_response, endpoint_name, API_ERRORS, API_HEDGES, CIRCUIT_OPEN
+
+# Overridable to point the bot at a stand-in server, see Fake_services.py
+BASE_URL = os.environ.get("SPORTMONKS_BASE_URL", "https://soccer.sportmonks.com/api/v2.0")
+
+# Request priorities, lower is more important
+PRIORITY_LIVE_ODDS = 0
+PRIORITY_STATS = 1
+PRIORITY_METADATA = 2
+PRIORITY_BACKGROUND = 3 # batch jobs, ex: the nightly team baselines
+
+# Share of the budget that must remain before a request of each priority may be sent,
+# keeps the last tokens of the hour for live odds instead of metadata, and half of it for live polling instead of batch jobs
+RESERVES = {PRIORITY_LIVE_ODDS: 0.0, PRIORITY_STATS: 0.05, PRIORITY_METADATA: 0.2, PRIORITY_BACKGROUND: 0.5}
+
+# Hard deadline in seconds of a request to each endpoint, the first matching prefix applies.
+# Live odds are only worth a bet while fresh, metadata may take longer
+TIMEOUTS = (
+    ("/odds/inplay", 5),
+    ("/livescores", 10),
+    ("/fixtures", 10),
+)
+DEFAULT_TIMEOUT = 20
+CONNECT_TIMEOUT = 3
+
+# Latency percentile of an endpoint after which a hedged second request is sent,
+# and share of the requests to an endpoint that may be hedged, so a slow API is not sent twice the load
+HEDGE_PERCENTILE = 0.95
+HEDGE_BUDGET = 0.05
+
+# Errors of an Api_result, when no usable response arrived
+TIMEOUT = "timeout"
+CONNECTION_ERROR = "connection error"
+CIRCUIT_OPEN_ERROR = "circuit open"
+
+
+def timeout_for(path):
+    """
+    @return: Number of seconds a request to path may take, see TIMEOUTS
+    """
+    for prefix, seconds in TIMEOUTS:
+        if path.startswith(prefix):
+            return seconds
+    return DEFAULT_TIMEOUT
+
+
+class Api_result:
+    """
+    Outcome of one sportmonks request, returned instead of raising so that callers
+    can tell a slow or degraded API from a bad response
+    """
+
+    __slots__ = ("path", "status", "content", "error", "seconds", "hedged")
+
+    def __init__(self, path, status=None, content=b"", error=None, seconds=0.0, hedged=False):
+        """
+        path: endpoint relative to the base url, ex: "/odds/inplay/fixture/18157"
+        status: HTTP status code, None if no response arrived
+        content: raw bytes of the body
+        error: TIMEOUT, CONNECTION_ERROR or CIRCUIT_OPEN_ERROR if no response arrived, None otherwise
+        seconds: Duration of the request
+        hedged: True if a second request was sent for it
+        """
+        self.path = path
+        self.status = status
+        self.content = content
+        self.error = error
+        self.seconds = seconds
+        self.hedged = hedged
+
+
+    @property
+    def status_code(self):
+        return self.status
+
+
+    @property
+    def ok(self):
+        return self.error is None and self.status is not None and self.status < 400
+
+
+    @property
+    def degraded(self):
+        """
+        @return: True if the API did not answer, or answered that it is overloaded or failing
+        """
+        return self.error is not None or self.status == 429 or self.status >= 500
+
+
+    def json(self):
+        return json.loads(self.content)
+
+
+    def __repr__(self):
+        if self.error:
+            return f"Api_result({self.path}: {self.error} after {self.seconds:.1f}s)"
+        return f"Api_result({self.path}: {self.status} in {self.seconds:.1f}s)"
+
+
+class Sportmonks_error(Exception):
+
+    def __init__(self, result):
+        """
+        Raised by the clients' get methods when no usable response arrived, the Api_result is kept in self.result
+        """
+        super().__init__(f"{result.path} {result.error or f'answered {result.status}'}")
+        self.result = result
+
+
+class Circuit_breaker:
+
+    def __init__(self, failure_threshold=5, reset_timeout=30):
+        """
+        Stops every request of the process for a while once the API looks degraded, instead of every observer
+        retrying on its own. Opens after failure_threshold degraded results in a row, then lets one trial
+        request through every reset_timeout seconds: the circuit closes once a trial succeeds
+
+        failure_threshold: Number of degraded results in a row that open the circuit
+        reset_timeout: Number of seconds the circuit stays open before a trial request
+        """
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.trial = False # a trial request is in flight
+        self.lock = threading.Lock()
+
+
+    def allow(self):
+        """
+        @return: True if a request may be sent now
+        """
+        with self.lock:
+            if self.opened_at is None:
+                return True
+            if self.trial or time.monotonic() - self.opened_at < self.reset_timeout:
+                return False
+            self.trial = True
+            return True
+
+
+    def record(self, result):
+        """
+        Counts the outcome of a request let through by allow()
+        """
+        with self.lock:
+            if not result.degraded:
+                if self.opened_at is not None:
+                    print("Sportmonks API answering again, circuit closed")
+                self.failures, self.opened_at, self.trial = 0, None, False
+                CIRCUIT_OPEN.set(0)
+                return
+            self.failures += 1
+            if self.trial or self.failures >= self.failure_threshold:
+                if self.opened_at is None:
+                    print(f"Sportmonks API degraded ({result}), circuit opened for {self.reset_timeout}s")
+                self.opened_at, self.trial = time.monotonic(), False
+                CIRCUIT_OPEN.set(1)
+
+
+    def is_open(self):
+        with self.lock:
+            return self.opened_at is not None
+
+
+class Latency_tracker:
+
+    def __init__(self, window=200, min_samples=20):
+        """
+        Recent request durations per endpoint, to hedge the requests slower than usual
+
+        window: Number of durations kept per endpoint
+        min_samples: Number of durations needed before a percentile is known
+        """
+        self.window = window
+        self.min_samples = min_samples
+        self.durations = {} # endpoint name -> deque of seconds
+        self.counts = {} # endpoint name -> [requests, hedged requests]
+        self.lock = threading.Lock()
+
+
+    def record(self, path, seconds):
+        with self.lock:
+            self.durations.setdefault(endpoint_name(path), deque(maxlen=self.window)).append(seconds)
+            self.counts.setdefault(endpoint_name(path), [0, 0])[0] += 1
+
+
+    def hedge(self, path, share=HEDGE_BUDGET):
+        """
+        Counts a hedged request to the endpoint of path, unless share of its requests were already hedged
+
+        @return: True if the hedged request may be sent
+        """
+        with self.lock:
+            counts = self.counts.setdefault(endpoint_name(path), [0, 0])
+            if counts[1] + 1 > share * counts[0]:
+                return False
+            counts[1] += 1
+            return True
+
+
+    def percentile(self, path, share=HEDGE_PERCENTILE):
+        """
+        @return: duration under which share of the recent requests to the endpoint of path answered, None if unknown
+        """
+        with self.lock:
+            durations = sorted(self.durations.get(endpoint_name(path), ()))
+        if len(durations) < self.min_samples:
+            return None
+        return durations[min(int(share * len(durations)), len(durations) - 1)]
+
+
+class Token_bucket:
+
+    def __init__(self, hourly_limit, reserves=RESERVES):
+        """
+        Constructor
+
+        hourly_limit: Number of requests the API plan allows per hour
+        reserves: dictionary of priority -> share of the bucket kept for more important requests
+        """
+        self.capacity = float(hourly_limit)
+        self.rate = hourly_limit / 3600.0
+        self.tokens = self.capacity
+        self.reserves = reserves
+        self.updated_at = time.monotonic()
+        self.lock = threading.Lock()
+
+
+    def refill(self):
+        """
+        Adds the tokens earned since the last refill, must be called holding self.lock
+        """
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+
+    def try_acquire(self, priority):
+        """
+        Takes a token if the budget allows a request of this priority
+
+        priority: one of the PRIORITY_ constants
+
+        @return: 0 if a token was taken, otherwise the number of seconds to wait before retrying
+        """
+
+        with self.lock:
+            self.refill()
+            reserve = self.reserves.get(priority, 0.0) * self.capacity
+            if self.tokens - 1 >= reserve:
+                self.tokens -= 1
+                return 0
+            return (reserve + 1 - self.tokens) / self.rate
+
+
+    def acquire(self, priority):
+        """
+        Blocks until a request of this priority may be sent
+        """
+        wait = self.try_acquire(priority)
+        while wait > 0:
+            time.sleep(min(wait, 1))
+            wait = self.try_acquire(priority)
+
+
+    async def acquire_async(self, priority):
+        """
+        Waits without blocking the event loop until a request of this priority may be sent
+        """
+        wait = self.try_acquire(priority)
+        while wait > 0:
+            await asyncio.sleep(min(wait, 1))
+            wait = self.try_acquire(priority)
+
+
+    def remaining(self):
+        """
+        @return: share of the hourly budget currently available, between 0 and 1
+        """
+        with self.lock:
+            self.refill()
+            return self.tokens / self.capacity
+
+
+class Shared_token_bucket(Token_bucket):
+
+    def __init__(self, hourly_limit, path, reserves=RESERVES):
+        """
+        Token_bucket whose tokens are kept in a file, so every process and container mounting it
+        draws from one hourly budget
+
+        path: File holding the budget, guarded by an flock on path + ".lock"
+        """
+        super().__init__(hourly_limit, reserves)
+        self.path = path
+        self.updated_at = time.time()
+        self.thread_lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True) # the workers may start before the shard directory exists
+        self.lock_file = open(path + ".lock", "a")
+        self.lock = self # the inherited methods hold self.lock, which here also syncs the tokens with the file
+
+
+    def __enter__(self):
+        self.thread_lock.acquire()
+        fcntl.flock(self.lock_file, fcntl.LOCK_EX)
+        try:
+            with open(self.path) as f:
+                state = json.load(f)
+            self.tokens, self.updated_at = state["tokens"], state["updated_at"]
+        except (OSError, ValueError, KeyError):
+            pass # first process to use the budget, start full
+
+
+    def __exit__(self, *exc):
+        with open(self.path, "w") as f:
+            json.dump({"tokens": self.tokens, "updated_at": self.updated_at}, f)
+        fcntl.flock(self.lock_file, fcntl.LOCK_UN)
+        self.thread_lock.release()
+
+
+    def refill(self):
+        """
+        Adds the tokens earned since the last refill by any process, wall clock time is shared between processes
+        """
+        now = time.time()
+        self.tokens = min(self.capacity, self.tokens + max(now - self.updated_at, 0) * self.rate)
+        self.updated_at = now
+
+
+class Sportmonks_client:
+
+    def __init__(self, api_token, hourly_limit=2000, pool_size=100, bucket=None, base_url=BASE_URL, breaker=None):
+        """
+        Constructor, one client is meant to be shared by the whole process
+
+        api_token: String of the sportmonks API token
+        hourly_limit: Number of requests the API plan allows per hour
+        pool_size: Number of keep-alive connections kept open to the API
+        bucket: Token_bucket to share with other clients, a new one is created if None
+        base_url: Root of the API, ex: "https://soccer.sportmonks.com/api/v2.0"
+        breaker: Circuit_breaker to share with other clients, a new one is created if None
+        """
+        self.api_token = api_token
+        self.base_url = base_url
+        self.pool_size = pool_size
+        self.bucket = bucket or Token_bucket(hourly_limit)
+        self.breaker = breaker or Circuit_breaker()
+        self.latencies = Latency_tracker()
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.executor = ThreadPoolExecutor(max_workers=pool_size, thread_name_prefix="sportmonks") # requests waited for until their deadline
+
+
+    def send(self, path, params, timeout):
+        """
+        Sends one GET request, the budget already taken. The body is read in chunks
+        and given up once timeout is over, requests only bounds the wait between two chunks
+
+        @return: Api_result
+        """
+        started = time.perf_counter()
+        try:
+            raw_response = self.session.get(url=self.base_url + path, params={"api_token": self.api_token, **(params or {})}, timeout=(CONNECT_TIMEOUT, timeout), stream=True)
+            with raw_response:
+                chunks = []
+                for chunk in raw_response.iter_content(64 * 1024):
+                    chunks.append(chunk)
+                    if time.perf_counter() - started > timeout:
+                        raise requests.Timeout(f"{path} still sending after {timeout}s")
+            content = b"".join(chunks)
+        except requests.Timeout:
+            error = TIMEOUT
+        except requests.RequestException:
+            error = CONNECTION_ERROR
+        else:
+            seconds = time.perf_counter() - started
+            record_response(path, raw_response.status_code, len(content), seconds)
+            self.latencies.record(path, seconds)
+            return Api_result(path, raw_response.status_code, content, seconds=seconds)
+        API_ERRORS.inc(endpoint=endpoint_name(path), error=error)
+        return Api_result(path, error=error, seconds=time.perf_counter() - started)
+
+
+    def wait_for(self, future, path, started, timeout):
+        """
+        Waits for a request sent in self.executor until its deadline, like the async client's total timeout
+
+        started: time.perf_counter() when the request was sent
+        timeout: Number of seconds the request may take
+
+        @return: Api_result of the request, a TIMEOUT one once the deadline is over
+        """
+        try:
+            return future.result(timeout=max(started + timeout - time.perf_counter(), 0))
+        except Future_timeout:
+            # counted in API_ERRORS by send once it gives up on its own
+            return Api_result(path, error=TIMEOUT, seconds=time.perf_counter() - started)
+
+
+    def send_hedged(self, path, params, priority, timeout):
+        """
+        Sends one GET request, and a second one if the first has not answered by the endpoint's
+        usual p95 and the budget allows it, the first usable response wins
+
+        @return: Api_result
+        """
+        started = time.perf_counter()
+        delay = self.latencies.percentile(path)
+        first = self.executor.submit(self.send, path, params, timeout)
+        if delay is None or delay >= timeout:
+            return self.wait_for(first, path, started, timeout)
+        try:
+            return first.result(timeout=delay)
+        except Future_timeout:
+            pass
+        if not self.latencies.hedge(path) or self.bucket.try_acquire(priority) > 0:
+            return self.wait_for(first, path, started, timeout)
+
+        API_HEDGES.inc(endpoint=endpoint_name(path))
+        second = self.executor.submit(self.send, path, params, timeout - delay)
+        done, pending = wait((first, second), timeout=max(started + timeout - time.perf_counter(), 0), return_when=FIRST_COMPLETED)
+        if not done:
+            result = Api_result(path, error=TIMEOUT, seconds=time.perf_counter() - started)
+        else:
+            result = next(iter(done)).result()
+            if result.degraded and pending:
+                result = self.wait_for(next(iter(pending)), path, started, timeout)
+        result.hedged = True
+        return result
+
+
+    def fetch(self, path, params=None, priority=PRIORITY_METADATA, hedge=False):
+        """
+        Sends a GET request to the sportmonks API once the budget allows it, unless the circuit is open.
+        Never raises: timeouts, connection errors and the open circuit are reported in the result
+
+        path: endpoint relative to self.base_url, ex: "/livescores/now"
+        params: dictionary of query parameters, the api token is added automatically
+        priority: one of the PRIORITY_ constants
+        hedge: True to send a second request if the first is slower than usual, ex: for live odds
+
+        @return: Api_result
+        """
+
+        if not self.breaker.allow():
+            API_ERRORS.inc(endpoint=endpoint_name(path), error=CIRCUIT_OPEN_ERROR)
+            return Api_result(path, error=CIRCUIT_OPEN_ERROR)
+        self.bucket.acquire(priority)
+        if hedge:
+            result = self.send_hedged(path, params, priority, timeout_for(path))
+        else:
+            started, timeout = time.perf_counter(), timeout_for(path)
+            result = self.wait_for(self.executor.submit(self.send, path, params, timeout), path, started, timeout)
+        self.breaker.record(result)
+        return result
+
+
+    def get(self, path, params=None, priority=PRIORITY_METADATA):
+        """
+        Sends a GET request to the sportmonks API once the budget allows it, see fetch()
+
+        @return: Api_result, raises Sportmonks_error if the API is degraded
+        """
+        result = self.fetch(path, params, priority)
+        if result.degraded:
+            raise Sportmonks_error(result)
+        return result
+
+
+class Async_sportmonks_client:
+
+    def __init__(self, api_token, session, bucket, base_url=BASE_URL, breaker=None, latencies=None):
+        """
+        Constructor
+
+        api_token: String of the sportmonks API token
+        session: aiohttp.ClientSession shared by the event loop
+        bucket: Token_bucket shared with the rest of the process
+        base_url: Root of the API, ex: "https://soccer.sportmonks.com/api/v2.0"
+        breaker: Circuit_breaker shared with the rest of the process, a new one is created if None
+        latencies: Latency_tracker shared with the rest of the process, a new one is created if None
+        """
+        self.api_token = api_token
+        self.base_url = base_url
+        self.session = session
+        self.bucket = bucket
+        self.breaker = breaker or Circuit_breaker()
+        self.latencies = latencies or Latency_tracker()
+
+
+    async def send(self, path, params, timeout):
+        """
+        Sends one GET request, the budget already taken, see Sportmonks_client.send
+
+        @return: Api_result
+        """
+        started = time.perf_counter()
+        try:
+            async with self.session.get(self.base_url + path, params={"api_token": self.api_token, **(params or {})}, timeout=aiohttp.ClientTimeout(total=timeout, connect=CONNECT_TIMEOUT)) as raw_response:
+                body = await raw_response.read()
+        except asyncio.TimeoutError:
+            error = TIMEOUT
+        except aiohttp.ClientError:
+            error = CONNECTION_ERROR
+        else:
+            seconds = time.perf_counter() - started
+            record_response(path, raw_response.status, len(body), seconds)
+            self.latencies.record(path, seconds)
+            return Api_result(path, raw_response.status, body, seconds=seconds)
+        API_ERRORS.inc(endpoint=endpoint_name(path), error=error)
+        return Api_result(path, error=error, seconds=time.perf_counter() - started)
+
+
+    async def send_hedged(self, path, params, priority, timeout):
+        """
+        Sends one GET request and a second one if the first is slower than usual, see Sportmonks_client.send_hedged.
+        The request still running once a usable response arrived is cancelled
+
+        @return: Api_result
+        """
+        delay = self.latencies.percentile(path)
+        first = asyncio.create_task(self.send(path, params, timeout))
+        if delay is None or delay >= timeout:
+            return await first
+        done, pending = await asyncio.wait({first}, timeout=delay)
+        if done or not self.latencies.hedge(path) or self.bucket.try_acquire(priority) > 0:
+            return await first
+
+        API_HEDGES.inc(endpoint=endpoint_name(path))
+        second = asyncio.create_task(self.send(path, params, timeout - delay))
+        done, pending = await asyncio.wait({first, second}, return_when=asyncio.FIRST_COMPLETED)
+        result = next(iter(done)).result()
+        if result.degraded and pending:
+            result = await next(iter(pending))
+        for task in pending:
+            task.cancel()
+        result.hedged = True
+        return result
+
+
+    async def fetch(self, path, params=None, priority=PRIORITY_METADATA, hedge=False):
+        """
+        Sends a GET request to the sportmonks API without blocking the event loop, see Sportmonks_client.fetch
+
+        @return: Api_result
+        """
+
+        if not self.breaker.allow():
+            API_ERRORS.inc(endpoint=endpoint_name(path), error=CIRCUIT_OPEN_ERROR)
+            return Api_result(path, error=CIRCUIT_OPEN_ERROR)
+        await self.bucket.acquire_async(priority)
+        if hedge:
+            result = await self.send_hedged(path, params, priority, timeout_for(path))
+        else:
+            result = await self.send(path, params, timeout_for(path))
+        self.breaker.record(result)
+        return result
+
+
+    async def get_bytes(self, path, params=None, priority=PRIORITY_METADATA):
+        """
+        Sends a GET request to the sportmonks API once the budget allows it, without blocking the event loop
+
+        @return: raw bytes of the response, raises Sportmonks_error if the API is degraded
+        """
+        result = await self.fetch(path, params, priority)
+        if result.degraded:
+            raise Sportmonks_error(result)
+        return result.content
+
+
+    async def get_json(self, path, params=None, priority=PRIORITY_METADATA):
+        """
+        Sends a GET request to the sportmonks API once the budget allows it, without blocking the event loop
+
+        @return: decoded json response
+        """
+        return json.loads(await self.get_bytes(path, params, priority))
@@ -0,0 +1,110 @@
+import gzip
+import json
+import os
+import threading
+import time
+
+class State_snapshot:
+
+    def __init__(self, path, interval=30, max_age=3*3600):
+        """
+        Periodically saves the schedule, the fixtures waited for and the state of every observer
+        to a gzip compressed json file, so a restarted app resumes every match in progress right away
+        instead of refetching, waiting for each fixture to start and losing its mute timer and history
+
+        path: File the snapshot is written to
+        interval: Number of seconds between two snapshots
+        max_age: Number of seconds after which a snapshot is too old to resume from
+        """
+        self.path = path
+        self.interval = interval
+        self.max_age = max_age
+        self.observers = {} # fixture id -> Observer currently observing it
+        self.lock = threading.Lock()
+
+
+    def add(self, observer):
+        """
+        Includes an observer in the snapshots, once it is observing
+        """
+        with self.lock:
+            self.observers[observer.game_id] = observer
+
+
+    def remove(self, game_id):
+        """
+        Excludes an observer from the snapshots, once its observation is over
+        """
+        with self.lock:
+            self.observers.pop(game_id, None)
+
+
+    def save(self, scheduler=None, watcher=None):
+        """
+        Writes the snapshot, replacing the previous one only once it is complete
+
+        scheduler: Kickoff_scheduler of the app
+        watcher: Status_watcher of the app, the fixtures it waits for are waited for again on restore
+        """
+        with self.lock:
+            observers = list(self.observers.values())
+        if watcher:
+            with watcher.lock:
+                pending = list(watcher.pending)
+        state = {
+            "saved_at": time.time(),
+            "schedule": scheduler.snapshot() if scheduler else None,
+            "pending": pending if watcher else [],
+            "observers": [observer.snapshot() for observer in observers],
+        }
+
+        temp_path = f"{self.path}.{os.getpid()}.tmp"
+        with gzip.open(temp_path, "wt", encoding="utf-8") as f:
+            json.dump(state, f, separators=(",", ":"))
+        os.replace(temp_path, self.path)
+
+
+    def load(self):
+        """
+        Reads the last snapshot
+
+        @return: dictionary of "saved_at", "schedule", "pending" and "observers", None if missing, unreadable or too old
+        """
+
+        if not os.path.exists(self.path):
+            return None
+
+        try:
+            with gzip.open(self.path, "rt", encoding="utf-8") as f:
+                state = json.load(f)
+        except:
+            print(f"State snapshot {self.path} could not be read, starting cold")
+            return None
+
+        if time.time() - state["saved_at"] > self.max_age:
+            print(f"State snapshot {self.path} is too old, starting cold")
+            return None
+        return state
+
+
+    def run(self, scheduler=None, watcher=None):
+        """
+        Saves a snapshot every self.interval seconds, forever
+        """
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.save(scheduler, watcher)
+            except Exception as e:
+                # ex: an observer's history changed size while it was copied, the next snapshot will do
+                print(f"State snapshot failed: {e}")
+
+
+    def start(self, scheduler=None, watcher=None):
+        """
+        Saves the snapshots in a background thread
+
+        @return: self
+        """
+        threading.Thread(target=self.run, args=(scheduler, watcher), daemon=True).start()
+        return self
@@ -0,0 +1,155 @@
+import asyncio
+import threading
+import time
+from Sportmonks_connector import PRIORITY_STATS
+
+class Status_watcher:
+
+    def __init__(self, client, on_live, on_timeout=None, interval=20, timeout=15*60, batch_size=50):
+        """
+        Waits for every pending fixture to go live with one batched /fixtures/multi request per interval,
+        instead of one /fixtures/{id} request per fixture
+
+        client: Sportmonks_client shared by the process
+        on_live: Called with (fixture id, fixture dictionary) as soon as a fixture reports LIVE or HT
+        on_timeout: Called with the fixture id of a fixture never reported live within timeout
+        interval: Number of seconds between two checks
+        timeout: Number of seconds a fixture is waited for, like the original 15 minutes
+        batch_size: Number of fixture ids per request
+        """
+        self.client = client
+        self.on_live = on_live
+        self.on_timeout = on_timeout
+        self.interval = interval
+        self.timeout = timeout
+        self.batch_size = batch_size
+        self.pending = {} # fixture id -> deadline
+        self.lock = threading.Lock()
+
+
+    def watch(self, game_id):
+        """
+        Adds a fixture to the ones waited for, it is included in the next check
+        """
+        with self.lock:
+            self.pending.setdefault(game_id, time.monotonic() + self.timeout)
+
+
+    def batches(self):
+        """
+        @return: list of the /fixtures/multi paths covering every pending fixture
+        """
+        with self.lock:
+            ids = sorted(self.pending)
+        return [f"/fixtures/multi/{','.join(str(i) for i in ids[n:n+self.batch_size])}" for n in range(0, len(ids), self.batch_size)]
+
+
+    def promote(self, response):
+        """
+        Hands the fixtures that went live to on_live
+
+        response: decoded json response of /fixtures/multi
+
+        @return: list of the fixture ids that went live
+        """
+
+        if "error" in response:
+            raise Exception(response["error"]["message"])
+
+        live = []
+        with self.lock:
+            for fixture in response["data"]:
+                status = (fixture.get("time") or {}).get("status")
+                if fixture["id"] in self.pending and status in ("LIVE", "HT"):
+                    del self.pending[fixture["id"]]
+                    live.append(fixture)
+
+        for fixture in live:
+            print(f"{fixture['id']} is now reported to be live, continues...")
+            self.on_live(fixture["id"], fixture)
+        return [fixture["id"] for fixture in live]
+
+
+    def expire(self):
+        """
+        Gives up on the fixtures past their deadline, whether or not their status could be checked
+
+        @return: list of the expired fixture ids
+        """
+        with self.lock:
+            expired = [game_id for game_id, deadline in self.pending.items() if deadline < time.monotonic()]
+            for game_id in expired:
+                del self.pending[game_id]
+
+        for game_id in expired:
+            print(f"{game_id} was never reported to be live")
+            if self.on_timeout:
+                self.on_timeout(game_id)
+        return expired
+
+
+    def check(self):
+        """
+        Checks the status of every pending fixture once
+
+        @return: list of the fixture ids that went live
+        """
+        live = []
+        for path in self.batches():
+            # Raises Sportmonks_error if the API is degraded, the fixtures are checked again on the next run
+            raw_response = self.client.get(path, priority=PRIORITY_STATS)
+            live += self.promote(raw_response.json())
+        return live
+
+
+    def run(self):
+        """
+        Checks the pending fixtures every self.interval seconds, forever
+        """
+        while True:
+            if self.pending:
+                try:
+                    self.check()
+                except Exception as e:
+                    print(f"Status check failed: {e}")
+                self.expire()
+            time.sleep(self.interval)
+
+
+class Async_status_watcher(Status_watcher):
+
+    def __init__(self, client, on_live, on_timeout=None, interval=20, timeout=15*60, batch_size=50):
+        """
+        Status_watcher running on the event loop
+
+        client: Async_sportmonks_client shared by the event loop
+        """
+        super().__init__(client, on_live, on_timeout, interval, timeout, batch_size)
+
+
+    async def check(self):
+        """
+        Checks the status of every pending fixture once, without blocking the event loop
+
+        @return: list of the fixture ids that went live
+        """
+        live = []
+        for path in self.batches():
+            # Raises Sportmonks_error if the API is degraded, see Status_watcher.check
+            response = await self.client.get_json(path, priority=PRIORITY_STATS)
+            live += self.promote(response)
+        return live
+
+
+    async def run(self):
+        """
+        Checks the pending fixtures every self.interval seconds, forever
+        """
+        while True:
+            if self.pending:
+                try:
+                    await self.check()
+                except Exception as e:
+                    print(f"Status check failed: {e}")
+                self.expire()
+            await asyncio.sleep(self.interval)
@@ -0,0 +1,299 @@
+from datetime import date, timedelta
+import argparse
+import glob
+import math
+import os
+import time
+import warnings
+import numpy as np
+from Match_history import STATS_FIELDS, team_values
+from Match_recorder import read_recording
+from Sportmonks_connector import PRIORITY_BACKGROUND
+
+# Stats are averaged per bucket of BUCKET_MINUTES minutes of play, the last bucket holds stoppage time
+BUCKET_MINUTES = 5
+N_BUCKETS = 90 // BUCKET_MINUTES + 1
+FIELDS = tuple(name for name, path in STATS_FIELDS)
+
+# Shares of the match, not totals that grow over the match
+NOT_CUMULATIVE = ("possessiontime",)
+CUMULATIVE = np.array([name not in NOT_CUMULATIVE for name in FIELDS])
+FINISHED = ("FT", "AET", "FT_PEN")
+
+# One row per team, values[bucket, field] is the team's average of the field at the end of the bucket
+BASELINE_DTYPE = np.dtype([("team_id", "<i8"), ("matches", "<i4"), ("values", "<f4", (N_BUCKETS, len(FIELDS)))])
+
+
+def bucket_of(minute):
+    """
+    @return: index of the bucket ending at or after minute, the latest snapshot before its end is its value
+    """
+    return min(max(math.ceil(minute / BUCKET_MINUTES) - 1, 0), N_BUCKETS - 1)
+
+
+def interpolate(curve, minute, cumulative):
+    """
+    Reads a curve between the ends of the buckets around minute, instead of the value at the end of its bucket
+    up to 5 minutes ahead. Cumulative stats start from 0 at kickoff
+
+    curve: array of shape (N_BUCKETS,) or (N_BUCKETS, len(FIELDS)), the value of each bucket at its end
+    cumulative: bool, or boolean array of len(FIELDS), True for the totals that grow over the match
+
+    @return: float or array of len(FIELDS), nan where unknown
+    """
+    position = minute / BUCKET_MINUTES - 1 # 0 at the end of the first bucket
+    if position >= N_BUCKETS - 1:
+        return curve[-1]
+    if position < 0:
+        start = np.where(cumulative, 0.0, curve[0])
+        return start + (position + 1) * (curve[0] - start)
+    lower = int(position)
+    weight = position - lower
+    before, after = curve[lower], curve[lower + 1]
+    value = (1 - weight) * before + weight * after
+    # a bucket no fixture covered, the other one is the best guess
+    if np.ndim(value) == 0:
+        return value if value == value else (after if before != before else before)
+    return np.where(np.isnan(value), np.where(np.isnan(before), after, before), value)
+
+
+def team_stats_of(fixture, team_id):
+    """
+    @return: stats dictionary of one team of a fixture, None if the fixture has none for it
+    """
+    for team_stats in ((fixture.get("stats") or {}).get("data") or []):
+        if team_stats.get("team_id") == team_id:
+            return team_stats
+    return None
+
+
+def full_time_curve(totals):
+    """
+    Spreads the full time stats of a match evenly over its buckets, for the matches only known from their final stats
+
+    totals: list of floats in the order of FIELDS
+
+    @return: array of shape (N_BUCKETS, len(FIELDS))
+    """
+    played = np.minimum((np.arange(N_BUCKETS) + 1) * BUCKET_MINUTES, 90) / 90
+    curve = np.outer(played, totals)
+    for name in NOT_CUMULATIVE:
+        curve[:, FIELDS.index(name)] = totals[FIELDS.index(name)]
+    return curve
+
+
+def fetch_team_curves(client, team_id, day, days):
+    """
+    Fetches the finished fixtures of a team over the days before day with their stats
+
+    @return: list of arrays of shape (N_BUCKETS, len(FIELDS)), one per fixture
+    """
+    path = f"/fixtures/between/{day - timedelta(days=days)}/{day - timedelta(days=1)}/{team_id}"
+    response = client.get(path, params={"include": "stats"}, priority=PRIORITY_BACKGROUND).json()
+    if "error" in response:
+        raise Exception(response["error"]["message"])
+
+    curves = []
+    for fixture in response.get("data") or []:
+        team_stats = team_stats_of(fixture, team_id)
+        if (fixture.get("time") or {}).get("status") in FINISHED and team_stats:
+            curves.append(full_time_curve(team_values(team_stats)))
+    return curves
+
+
+def recorded_curves(recordings_dir, team_ids):
+    """
+    Reads the matches recorded by Match_recorder, which give the stats minute by minute instead of only at full time
+
+    @return: dictionary of team id -> list of arrays of shape (N_BUCKETS, len(FIELDS)), nan for the buckets never recorded
+    """
+    curves = {}
+    for path in glob.glob(os.path.join(recordings_dir, "*.jsonl.gz")):
+        match = {} # team id -> curve
+        for record in read_recording(path):
+            fixture = record["data"]
+            minute = (fixture.get("time") or {}).get("minute") if record["kind"] == "livescores" else None
+            if minute is None:
+                continue
+            for team_id in (fixture.get("localteam_id"), fixture.get("visitorteam_id")):
+                team_stats = team_stats_of(fixture, team_id)
+                if team_id in team_ids and team_stats:
+                    curve = match.setdefault(team_id, np.full((N_BUCKETS, len(FIELDS)), np.nan))
+                    curve[bucket_of(minute)] = team_values(team_stats) # the latest snapshot of a bucket wins
+        for team_id, curve in match.items():
+            curves.setdefault(team_id, []).append(curve)
+    return curves
+
+
+def build_baselines(client, team_ids, path, day=None, days=120, recordings_dir=None, max_requests=None):
+    """
+    Computes the baseline of every team and replaces the file at path once complete.
+    Meant to run once a night for the teams playing the next day. Nothing is written if no team
+    has a baseline, ex: the API failed, so the build is not taken as done and runs again
+
+    client: Sportmonks_client
+    team_ids: ids of the teams to compute
+    path: .npy file read by Team_baselines
+    day: day the baselines are for, only the fixtures before it are used, today if None
+    days: Number of days of fixtures averaged
+    recordings_dir: Directory of recorded matches, None to only use the full time stats
+    max_requests: Number of teams whose fixtures are fetched, the others only use their recordings, None for no cap
+
+    @return: Number of teams with a baseline
+    """
+
+    day = day or date.today()
+    team_ids = sorted(set(team_ids))
+    recorded = recorded_curves(recordings_dir, set(team_ids)) if recordings_dir else {}
+
+    rows = []
+    for i, team_id in enumerate(team_ids):
+        curves = []
+        if max_requests is None or i < max_requests:
+            try:
+                curves = fetch_team_curves(client, team_id, day, days)
+            except Exception as e:
+                print(f"No baseline for team {team_id}: {e}")
+        elif i == max_requests:
+            print(f"Request cap of {max_requests} reached, the other teams only use their recordings")
+        curves += recorded.get(team_id, [])
+        if curves:
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore", RuntimeWarning) # buckets no fixture covers stay nan
+                values = np.nanmean(np.stack(curves), axis=0)
+            rows.append((team_id, len(curves), values))
+    if not rows:
+        return 0
+
+    table = np.zeros(len(rows), dtype=BASELINE_DTYPE)
+    for i, (team_id, matches, values) in enumerate(rows):
+        table[i] = (team_id, matches, values)
+
+    temp_path = f"{path}.{os.getpid()}.tmp.npy"
+    np.save(temp_path, table)
+    os.replace(temp_path, path)
+
+    # The day the file is for, so a process tells a file of an earlier day whatever its age
+    with open(temp_path, "w") as f:
+        f.write(day.isoformat())
+    os.replace(temp_path, f"{path}.day")
+    return len(rows)
+
+
+class Team_baselines:
+
+    def __init__(self, path):
+        """
+        Memory mapped baselines of the teams written by build_baselines, looked up in constant time
+        without any network request, ex: the dangerous attacks a team usually has after 60 minutes
+
+        path: .npy file written by build_baselines, lookups return nan until it exists, None for no baselines
+        """
+        self.path = path
+        self.table = ({}, None) # (team id -> row, values), swapped at once so lookups never mix two files
+        self.loaded_mtime = None
+        self.columns = {name: i for i, name in enumerate(FIELDS)}
+        self.load()
+
+
+    def load(self):
+        """
+        Maps the current file, ex: after the nightly build replaced it
+        """
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            self.loaded_mtime = os.path.getmtime(self.path)
+            table = np.load(self.path, mmap_mode="r")
+        except (OSError, ValueError):
+            print(f"Team baselines {self.path} could not be read")
+            return
+        self.table = ({int(team_id): i for i, team_id in enumerate(table["team_id"])}, table["values"])
+
+
+    def refresh(self):
+        """
+        Maps the file again if it was replaced since it was loaded, ex: by another worker's nightly build
+        """
+        if self.path and os.path.exists(self.path) and os.path.getmtime(self.path) != self.loaded_mtime:
+            self.load()
+
+
+    def age(self):
+        """
+        @return: Number of seconds since the file was written, None if it doesn't exist
+        """
+        if not self.path or not os.path.exists(self.path):
+            return None
+        return max(time.time() - os.path.getmtime(self.path), 0)
+
+
+    def day(self):
+        """
+        @return: date the file was built for, None if it doesn't exist or predates the day being saved
+        """
+        try:
+            with open(f"{self.path}.day") as f:
+                return date.fromisoformat(f.read().strip())
+        except (OSError, TypeError, ValueError):
+            return None
+
+
+    def expected(self, team_id, field, minute):
+        """
+        Looks up a team's usual value of a stat at a minute
+
+        team_id: id of the team
+        field: name in STATS_FIELDS, ex: "dangerous_attacks"
+        minute: match minute
+
+        @return: float, nan if the team or minute is unknown
+        """
+        rows, values = self.table
+        row = rows.get(int(team_id)) if team_id is not None else None
+        if row is None or minute is None:
+            return np.nan
+        column = self.columns[field]
+        return float(interpolate(values[row, :, column], float(minute), CUMULATIVE[column]))
+
+
+    def expected_row(self, team_id, minute):
+        """
+        @return: array of a team's usual values at a minute in the order of STATS_FIELDS, nan if unknown
+        """
+        rows, values = self.table
+        row = rows.get(int(team_id)) if team_id is not None else None
+        if row is None or minute is None or np.isnan(minute):
+            return np.full(len(FIELDS), np.nan)
+        return np.asarray(interpolate(values[row].astype(float), float(minute), CUMULATIVE), dtype=float)
+
+
+    def __len__(self):
+        return len(self.table[0])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Computes the baselines of the teams playing on a day, meant to run nightly")
+    parser.add_argument("--day", type=date.fromisoformat, help="day to compute the teams of, tomorrow if not given")
+    parser.add_argument("--days", type=int, default=120, help="number of days of fixtures averaged")
+    args = parser.parse_args()
+
+    from app import import_credentials, import_setting, new_sportmonks_client
+    from Kickoff_scheduler import Kickoff_scheduler
+
+    sportmonks_token = import_credentials()[4]
+    client = new_sportmonks_client(sportmonks_token)
+    scheduler = Kickoff_scheduler(client, import_setting('timezone', 'Europe/Stockholm'))
+    day = args.day or (scheduler.now() + timedelta(days=1)).date()
+    fixtures = scheduler.fetch_day(day)
+    team_ids = {fixture["localteam_id"] for fixture in fixtures} | {fixture["visitorteam_id"] for fixture in fixtures}
+    path = import_setting('baselines_file', 'team_baselines.npy')
+    count = build_baselines(client, team_ids, path, day, args.days, import_setting('recordings_dir'), import_setting('baselines_max_requests', 300))
+    if count:
+        print(f"Baselines of {count} of the {len(team_ids)} teams playing on {day} written to {path}")
+    else:
+        print(f"None of the {len(team_ids)} teams playing on {day} has a baseline, {path} left as it was")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,246 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+import threading
+import time
+import numpy as np
+from Game_observer import Observer
+from Match_history import STATS_COLUMNS, team_values
+from Slack_connector import Slack_message_bot
+from Metrics import TICK_SECONDS, EVALUATE_SECONDS, ACTIVE_OBSERVERS, record_signal
+
+class Fixture_columns:
+
+    def __init__(self, rows, baselines=None):
+        """
+        Packs the stats and bet365 asian handicap lines of every live fixture into column arrays,
+        row i of every array belongs to self.fixture_ids[i]
+
+        rows: list of (Observer, stats, odds) tuples, as returned by the observers' fetch methods
+        baselines: Team_baselines filling self.expected, None to leave it nan
+        """
+        n = len(rows)
+        width = max([len(odds) for o, stats, odds in rows] + [1])
+
+        self.fixture_ids = [o.game_id for o, stats, odds in rows]
+        self.localteam_ids = [o.localteam_id for o, stats, odds in rows]
+        self.visitorteam_ids = [o.visitorteam_id for o, stats, odds in rows]
+        self.minute = np.array([np.nan if o.minute is None else o.minute for o, stats, odds in rows], dtype=float)
+
+        # stats columns, ex: self.stats["localteam_dangerous_attacks"]
+        values = np.full((n, len(STATS_COLUMNS)), np.nan)
+        for i, (o, stats, odds) in enumerate(rows):
+            values[i] = team_values(stats.get("localteam")) + team_values(stats.get("visitorteam"))
+        self.stats = {name: values[:, j] for j, name in enumerate(STATS_COLUMNS)}
+
+        # what each team usually has by this minute, same columns as self.stats, ex: self.expected["localteam_dangerous_attacks"]
+        expected = np.full((n, len(STATS_COLUMNS)), np.nan)
+        if baselines:
+            for i, (o, stats, odds) in enumerate(rows):
+                expected[i] = np.concatenate([baselines.expected_row(o.localteam_id, self.minute[i]), baselines.expected_row(o.visitorteam_id, self.minute[i])])
+        self.expected = {name: expected[:, j] for j, name in enumerate(STATS_COLUMNS)}
+
+        # odds lines, padded to the fixture offering the most lines; label is 1 (localteam), 2 (visitorteam) or 0 (padding)
+        self.label = np.zeros((n, width), dtype=np.int8)
+        self.handicap = np.full((n, width), np.nan)
+        self.value = np.full((n, width), np.nan)
+        self.probability = np.full((n, width), np.nan)
+        for i, (o, stats, odds) in enumerate(rows):
+            for j, line in enumerate(odds):
+                if line.label in ("1", "2") and isinstance(line.handicap, float):
+                    self.label[i, j] = int(line.label)
+                    self.handicap[i, j] = line.handicap
+                    self.value[i, j] = np.nan if line.value is None else line.value
+                    self.probability[i, j] = np.nan if line.probability is None else line.probability
+        self.valid = self.label > 0
+
+
+    def __len__(self):
+        return len(self.fixture_ids)
+
+
+class Vectorised_strategy:
+    """
+    Scores every live fixture in one NumPy pass. Subclass it and override score() with your evaluation criteria
+    """
+
+    def score(self, columns):
+        """
+        Decide which fixtures to bet on
+
+        columns: Fixture_columns of every live fixture
+
+        @return: boolean array, True for the fixtures to bet on, and an int array of the label to bet on,
+                 1 for the localteam and 2 for the visitorteam
+
+        Example, bet on the localteam when it has more than twice the dangerous attacks of the visitorteam:
+                local = columns.stats["localteam_dangerous_attacks"]
+                visitor = columns.stats["visitorteam_dangerous_attacks"]
+                bet = local > 2 * visitor
+                return bet, np.ones(len(columns), dtype=np.int8)
+
+        or when it has 50% more dangerous attacks than it usually has by this minute:
+                bet = columns.stats["localteam_dangerous_attacks"] > 1.5 * columns.expected["localteam_dangerous_attacks"]
+        """
+        return np.zeros(len(columns), dtype=bool), np.ones(len(columns), dtype=np.int8)
+
+
+    def decisions(self, columns):
+        """
+        Turns the scores into the decisions evaluate_situation() returns
+
+        @return: dictionary of fixture id -> {"bet", "onTeam", "odds"}
+        """
+        bet, on_label = self.score(columns)
+        results = {game_id: {"bet": False} for game_id in columns.fixture_ids}
+        for i in np.flatnonzero(bet):
+            team_id = columns.localteam_ids[i] if on_label[i] == 1 else columns.visitorteam_ids[i]
+            odds = columns.value[i][columns.valid[i] & (columns.label[i] == on_label[i])]
+            results[columns.fixture_ids[i]] = {"bet": True, "onTeam": team_id, "odds": odds.tolist()}
+        return results
+
+
+class Batch_observer:
+
+    def __init__(self, strategy, api_token, slack_notifications_channel, slack_errors_channel, slack_token, poller=None, client=None, cache=None, dispatcher=None, snapshots=None, baselines=None, parse_pool=None):
+        """
+        Observes every live fixture from a single loop, evaluating all of them at once each tick
+
+        strategy: Vectorised_strategy deciding the bets
+        poller: Livescores_poller shared by all fixtures
+        client: Sportmonks_client shared by all fixtures, the due fixtures are fetched over as many threads as its connection pool
+        cache: Metadata_cache shared by all fixtures
+        dispatcher: Slack_dispatcher shared by all fixtures
+        snapshots: State_snapshot the observed fixtures are saved to, None to not save them
+        baselines: Team_baselines shared by all fixtures
+        parse_pool: Parse_pool decoding the odds of every fixture in worker processes
+        """
+        self.strategy = strategy
+        self.api_token = api_token
+        self.notifications_channel = slack_notifications_channel
+        self.errors_channel = slack_errors_channel
+        self.slacktoken = slack_token
+        self.poller = poller
+        self.client = client
+        self.cache = cache
+        self.dispatcher = dispatcher
+        self.snapshots = snapshots
+        self.baselines = baselines
+        self.parse_pool = parse_pool
+        self.fixtures = {} # game_id -> {"observer", "next_poll"}
+        self.lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=getattr(client, "pool_size", 10), thread_name_prefix="batch")
+
+        # Create messaging bot and establish its connection
+        self.notificator = Slack_message_bot(slack_token, slack_notifications_channel, dispatcher=dispatcher)
+        self.notificator.connect()
+
+
+    def add(self, game_id, fixture=None, snapshot=None):
+        """
+        Waits in a background thread for the fixture to go live, then includes it in the evaluation
+
+        fixture: fixture dictionary of a fixture a Status_watcher saw go live, None to wait for it here
+        snapshot: Observer snapshot saved before a restart, to resume the fixture right away
+        """
+        threading.Thread(target=self.start_fixture, args=(game_id, fixture, snapshot), daemon=True).start()
+
+
+    def start_fixture(self, game_id, fixture=None, snapshot=None):
+        """
+        Procedure for safely adding a fixture, the counterpart of app.new_game_observer
+        """
+        o = Observer(game_id, self.api_token, self.notifications_channel, self.errors_channel, self.slacktoken, self.poller, self.client, self.cache, dispatcher=self.dispatcher, baselines=self.baselines, parse_pool=self.parse_pool)
+        if not o.connection_working():
+            return
+        if snapshot:
+            o.restore(snapshot)
+        elif fixture:
+            o.promote(fixture)
+        elif not o.wait_for_game_to_start():
+            return
+
+        # Same timing as Observer.observe: observe for 90 minutes, polling when the fixture's scheduler says so
+        now = datetime.now()
+        if not o.match_ends:
+            o.match_ends = now + timedelta(minutes=90)
+            o.muted_until = now
+        next_poll = now if o.restored else now + timedelta(seconds=o.time_to_next_poll(o.muted_until))
+        ACTIVE_OBSERVERS.inc()
+        with self.lock:
+            self.fixtures[game_id] = {"observer": o, "next_poll": next_poll}
+        if self.snapshots:
+            self.snapshots.add(o)
+
+
+    def fetch(self, o):
+        """
+        Fetches the stats and odds of one fixture, in one of the executor's threads
+
+        @return: (Observer, stats, odds), None if the fixture is skipped this tick
+        """
+        try:
+            stats = o.fetch_current_data()
+            odds = o.fetch_current_odds() if stats is not None else None
+        except Exception as e:
+            print(f"{o.game_id} skipped this tick: {e}")
+            return None
+        if stats is None or odds is None:
+            return None # the API did not answer in time, already reported
+        return o, stats, odds
+
+
+    def tick(self):
+        """
+        Fetches every fixture due for a poll, packs them into columns and evaluates them all at once
+
+        @return: dictionary of fixture id -> decision
+        """
+        started = time.perf_counter()
+        now = datetime.now()
+        with self.lock:
+            for game_id in [g for g, f in self.fixtures.items() if f["observer"].match_ends <= now]:
+                print(f"Match {game_id} ended")
+                if self.poller:
+                    self.poller.unwatch(game_id)
+                if self.snapshots:
+                    self.snapshots.remove(game_id)
+                del self.fixtures[game_id]
+                ACTIVE_OBSERVERS.dec()
+            active = [f for f in self.fixtures.values() if f["next_poll"] <= now]
+
+        # Fetched concurrently, a tick takes about as long as its slowest fixture instead of the sum of them all
+        rows = [row for row in self.executor.map(self.fetch, [f["observer"] for f in active]) if row]
+        for o, stats, odds in rows:
+            o.history.record(o.minute, stats, odds)
+            o.scheduler.record_odds(odds)
+
+        # Only the fixtures whose stats or odds changed are evaluated
+        changed = [(o, stats, odds) for o, stats, odds in rows if o.has_changed(stats, odds)]
+        evaluate_started = time.perf_counter()
+        results = self.strategy.decisions(Fixture_columns(changed, self.baselines)) if changed else {}
+        EVALUATE_SECONDS.observe(time.perf_counter() - evaluate_started, mode="vectorised")
+        for o, stats, odds in changed:
+            result = results[o.game_id]
+            if result["bet"]:
+                record_signal(odds)
+                self.notificator.post_message(f'A bet should be placed now, on *{result["onTeam"]}*, {o.fetch_team_from_id(result["onTeam"])} on one of these good bets: *{result["odds"]}*')
+                o.muted_until = datetime.now()+timedelta(minutes=15)
+
+        # Schedule every polled fixture's next poll, the skipped ones included
+        with self.lock:
+            for o in [f["observer"] for f in active]:
+                f = self.fixtures.get(o.game_id)
+                if f:
+                    f["next_poll"] = datetime.now() + timedelta(seconds=o.time_to_next_poll(o.muted_until))
+        if active:
+            TICK_SECONDS.observe(time.perf_counter() - started, mode="vectorised")
+        return results
+
+
+    def run(self, interval=10):
+        """
+        Evaluates the fixtures due for a poll every interval seconds, forever
+        """
+        while True:
+            time.sleep(interval)
+            self.tick()
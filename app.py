@@ -1,12 +1,27 @@
 import slack
-from Slack_connector import Slack_message_bot
+from Slack_connector import Slack_message_bot, Slack_dispatcher
 from Game_observer import Observer
-from datetime import datetime as dt
-from datetime import timedelta
-import requests
+from Livescores_poller import Livescores_poller, Async_livescores_poller
+from Async_observer import Async_observer
+from Metadata_cache import Metadata_cache
+from Match_recorder import Match_recorder
+from Vectorised_evaluation import Batch_observer
+from Sportmonks_connector import Sportmonks_client, Async_sportmonks_client, Shared_token_bucket
+from Shard_coordinator import Shard_coordinator, default_worker_id
+from Kickoff_scheduler import Kickoff_scheduler
+from Status_watcher import Status_watcher, Async_status_watcher
+from Metrics import Metrics_server
+from State_snapshot import State_snapshot
+from Team_baselines import Team_baselines, build_baselines
+from Parse_pool import Parse_pool, default_workers
 import json
+import importlib
+import multiprocessing
+import os
 import time
 import _thread
+import asyncio
+import aiohttp
 
 def import_credentials():
     """
@@ -32,149 +47,472 @@ def import_credentials():
     return data['slack_token'], data['slack_notifications_channel'], errors_channel, application_logs_channel, data['sportmonks_api_token']
 
 
-def currently_active_game():
+def import_setting(key, default=None):
     """
-    Check if there is a currently active game
+    Import an optional setting from credentials.json
 
-    @return: id of active game
+    key: name of the setting
+    default: value returned if the setting is not specified
+
+    @return: value of the setting
+    """
+
+    data = json.load(open('credentials.json',))
+
+    # allow for settings not to be specified
+    try:
+        return data[key]
+    except:
+        return default
+
+
+def load_class(spec):
+    """
+    Import a class from a "module:Class" string, ex: "Vectorised_evaluation:Vectorised_strategy"
+
+    @return: the class
+    """
+
+    module_name, class_name = spec.split(":")
+    return getattr(importlib.import_module(module_name), class_name)
+
+
+def new_sportmonks_client(sportmonks_token):
+    """
+    Creates the sportmonks client of the process, drawing from the budget shared by every worker when sharded
+
+    @return: Sportmonks_client
+    """
+    hourly_limit = import_setting('sportmonks_hourly_limit', 2000)
+    shard_dir = import_setting('shard_dir')
+    bucket = Shared_token_bucket(hourly_limit, os.path.join(shard_dir, 'budget.json')) if shard_dir else None
+    return Sportmonks_client(sportmonks_token, hourly_limit, bucket=bucket)
+
+
+def new_coordinator(on_claim, worker_id):
+    """
+    Starts the heartbeats of this worker if the fixtures are split between workers sharing shard_dir
+
+    on_claim: Called with the id of every fixture this worker takes on
+    worker_id: Unique name of this worker
+
+    @return: Shard_coordinator, None if not sharded
+    """
+    shard_dir = import_setting('shard_dir')
+    if not shard_dir:
+        return None
+    coordinator = Shard_coordinator(shard_dir, on_claim, worker_id)
+    coordinator.heartbeat()
+    _thread.start_new_thread(coordinator.run, ())
+    print(f"Worker {worker_id} sharing the fixtures in {shard_dir}")
+    return coordinator
+
+
+def new_state_snapshot(worker_index=None):
+    """
+    Creates the state snapshot of this process, every worker process keeps its own file
+
+    worker_index: Index of this process when sharded, None for a single process
+
+    @return: State_snapshot, None if snapshot_file is empty
+    """
+    path = import_setting('snapshot_file', 'state_snapshot.json.gz')
+    if not path:
+        return None
+    if worker_index is not None:
+        # state_snapshot.json.gz -> state_snapshot-0.json.gz, only the file name is split, never its directories
+        directory, name = os.path.split(path)
+        root, extension = name.split(".", 1) if "." in name else (name, "")
+        path = os.path.join(directory, f"{root}-{worker_index}.{extension}" if extension else f"{root}-{worker_index}")
+    return State_snapshot(path, import_setting('snapshot_interval', 30))
+
+
+def resume_from_snapshot(state, scheduler, watcher, start_observer, coordinator=None):
     """
+    Resumes what was going on before a restart: the schedule, the games waited for and the games observed.
+    When sharded, a game is only resumed if this worker can still claim it
 
-    if upcoming_games:
-        next_game = upcoming_games[0]
-    else:
-        next_game = [dt.now()+timedelta(weeks=100)]
-    # Get current time
-    time_now = str(dt.now().time())[:-10] # gives string ex: '14:55'
-    time_now = dt.strptime(time_now,'%H:%M')
+    state: dictionary loaded by State_snapshot.load
+    start_observer: Called with (fixture id, None, observer snapshot) for every game observed
 
-    # If a game in upcoming_games has started, return its ID
-    if next_game[0] <= time_now:
-        # Remove first element of games list
-        upcoming_games.pop(0)
+    @return: list of the fixture ids of the resumed observers
+    """
+    if state["schedule"]:
+        scheduler.restore(state["schedule"])
+    for game_id in state["pending"]:
+        if not coordinator or coordinator.offer(game_id):
+            watcher.watch(game_id)
+    resumed = []
+    for snapshot in state["observers"]:
+        if not coordinator or coordinator.offer(snapshot["game_id"]):
+            start_observer(snapshot["game_id"], None, snapshot)
+            resumed.append(snapshot["game_id"])
+    return resumed
+
+
+def new_team_baselines():
+    """
+    @return: Team_baselines of the process, with no baselines if baselines_file is empty
+    """
+    return Team_baselines(import_setting('baselines_file', 'team_baselines.npy'))
 
-        # Return the game ID
-        return next_game[1]
 
-    # Option: Run past games that are still running
-    if len(past_games) > 0:
-        if past_games[-1][0] >= time_now-timedelta(minutes=80):
-            print(f"A past game is still running, returning its id {past_games[-1][1]}")
-            temp = str(past_games[-1][1])
-            past_games.pop(-1)
-            return temp
+def baselines_due(baselines, scheduler, worker_index=None):
+    """
+    worker_index: Index of this process when sharded, only the first worker process builds the file they share
 
-    # Else return Null
-    return None
+    @return: True if this process builds the baselines and the file is missing or was built for another day
+    """
+    if not baselines.path or not import_setting('baselines_build', True) or worker_index not in (None, 0):
+        return False
+    return baselines.day() != scheduler.now().date()
 
 
-def new_game_observer(game_id, api_token, notifications_channel, errors_channel, slack_token):
+def update_baselines(baselines, scheduler, client, application_logger):
+    """
+    Computes the baselines of every team playing today and maps them, meant to run in the background once a night.
+    Its requests only draw on the budget live polling leaves, at most baselines_max_requests of them
+
+    baselines: Team_baselines shared by the observers
+    scheduler: Kickoff_scheduler, its fetch_day lists the teams
+    client: Sportmonks_client
+    """
+    try:
+        day = scheduler.now().date()
+        fixtures = scheduler.fetch_day(day)
+        team_ids = {fixture["localteam_id"] for fixture in fixtures} | {fixture["visitorteam_id"] for fixture in fixtures}
+        count = build_baselines(client, team_ids, baselines.path, day, import_setting('baselines_days', 120), import_setting('recordings_dir'), import_setting('baselines_max_requests', 300))
+    except Exception as e:
+        print(f"The team baselines could not be built: {e}")
+        application_logger.post_message(f"*Exception:* The team baselines could not be built: {e}")
+        return
+    baselines.load()
+    application_logger.post_message(f'*Team baselines:* {count} of the {len(team_ids)} teams playing on {day}')
+
+
+def format_games(games):
+    """
+    @return: printable list of (kickoff, fixture id) tuples, ex: ['game 18157 at 15:00']
+    """
+    return [f"game {game_id} at {kickoff.strftime('%H:%M')}" for kickoff, game_id in games]
+
+
+def refresh_schedule(scheduler, application_logger):
+    """
+    Merges late changes of the fixtures into the kickoff schedule, logging the changes
+
+    @return: list of (kickoff, fixture id) tuples that were added or moved
+    """
+    try:
+        changes = scheduler.refresh()
+    except Exception as e:
+        print(f"The schedule could not be refreshed: {e}")
+        application_logger.post_message(f"*Exception:* The schedule could not be refreshed: {e}")
+        return []
+    if changes:
+        print(f'Schedule changes:\n {format_games(changes)}\n')
+    return changes
+
+
+def new_game_observer(game_id, api_token, notifications_channel, errors_channel, slack_token, poller=None, client=None, cache=None, dispatcher=None, fixture=None, snapshots=None, snapshot=None, baselines=None, parse_pool=None):
     """
     Procedure for safely starting up a new game observer
 
+    poller: Livescores_poller shared by all observers, None to let the observer fetch on its own
+    client: Sportmonks_client shared by all observers
+    cache: Metadata_cache shared by all observers
+    dispatcher: Slack_dispatcher shared by all observers
+    fixture: fixture dictionary of a game the Status_watcher saw go live, None to wait for it here
+    snapshots: State_snapshot the observer is saved to, None to not save it
+    snapshot: Observer snapshot saved before a restart, to resume the game right away
+    baselines: Team_baselines shared by all observers
+    parse_pool: Parse_pool shared by all observers, None to parse in the observer's thread
+
     @return: -1 when done
     """
 
-    # Instantiate observer
-    o = Observer(game_id, api_token, notifications_channel, errors_channel, slack_token)
+    # Instantiate observer, recording what it sees if a recordings directory is specified
+    recordings_dir = import_setting('recordings_dir')
+    recorder = Match_recorder.for_fixture(recordings_dir, game_id) if recordings_dir else None
+    o = Observer(game_id, api_token, notifications_channel, errors_channel, slack_token, poller, client, cache, recorder, dispatcher, baselines, parse_pool)
 
     # Assert connection is working
     if not o.connection_working():
         raise Exception("Connection to sportmonks API is not working")
 
-    # Wait for API to confirm game is live
-    game_started = o.wait_for_game_to_start()
-    if not game_started:
+    # Resume a game observed before a restart, take over a game already confirmed live, or wait for API to confirm game is live
+    if snapshot:
+        o.restore(snapshot)
+    elif fixture:
+        o.promote(fixture)
+    elif not o.wait_for_game_to_start():
         return -1
 
-    # Start observing game
-    o.observe()
+    # Start observing game, saving its state until it is over
+    if snapshots:
+        snapshots.add(o)
+    try:
+        o.observe()
+    finally:
+        if snapshots:
+            snapshots.remove(game_id)
 
     # Terminate
     print("Game observer closes")
     return -1
 
 
-def fetch_upcoming_games(api_token, summertime):
+async def new_async_game_observer(game_id, api_token, notifications_channel, errors_channel, slack_token, client, poller=None, cache=None, dispatcher=None, fixture=None, snapshots=None, snapshot=None, baselines=None, parse_pool=None):
     """
-    Fetch upcoming games from API and stores upcoming and past games in their
-    respective lists upcoming_games and past_games.
+    Procedure for safely starting up a new game observer as a coroutine on the event loop
+
+    client: Async_sportmonks_client shared by all observers
+    poller: Async_livescores_poller shared by all observers
+    cache: Metadata_cache shared by all observers
+    dispatcher: Slack_dispatcher shared by all observers
+    fixture: fixture dictionary of a game the Async_status_watcher saw go live, None to wait for it here
+    snapshots: State_snapshot the observer is saved to, None to not save it
+    snapshot: Observer snapshot saved before a restart, to resume the game right away
+    baselines: Team_baselines shared by all observers
+    parse_pool: Parse_pool shared by all observers, None to parse on the event loop
 
-    @return: None
+    @return: -1 when done
     """
-    global upcoming_games, past_games
 
-    upcoming_games = []
-    past_games = []
+    # Instantiate observer, recording what it sees if a recordings directory is specified
+    recordings_dir = import_setting('recordings_dir')
+    recorder = Match_recorder.for_fixture(recordings_dir, game_id) if recordings_dir else None
+    o = Async_observer(game_id, api_token, notifications_channel, errors_channel, slack_token, client, poller, cache, recorder, dispatcher, baselines, parse_pool)
 
-    # Fetch the upcoming games
-    raw_response = requests.get(url=f"https://soccer.sportmonks.com/api/v2.0/fixtures/date/{dt.now().date()}", params={"api_token": api_token, "tz": "CET"})
-    response = raw_response.json()
+    # Assert connection is working
+    if not await o.connection_working():
+        raise Exception("Connection to sportmonks API is not working")
 
+    # Resume a game observed before a restart, take over a game already confirmed live, or wait for API to confirm game is live
+    if snapshot:
+        o.restore(snapshot)
+    elif fixture:
+        await o.promote(fixture)
+    elif not await o.wait_for_game_to_start():
+        return -1
+
+    # Start observing game, saving its state until it is over
+    if snapshots:
+        snapshots.add(o)
     try:
-        data = response['data']
-    except:
-        raise Exception("The sportmonks response did not contain any data, double check your account subscription status and the information provided in credentials.json")
+        await o.observe()
+    finally:
+        if snapshots:
+            snapshots.remove(game_id)
 
-    # Save current time
-    time_now = str(dt.now().time())[:-10] # gives string ex: '14:55'
-    time_now = dt.strptime(time_now,'%H:%M')
+    # Terminate
+    print("Game observer closes")
+    return -1
 
-    # Add all upcoming matches to upcoming_games
-    for i in data:
-        id = i["id"]
-        time = i["time"]["starting_at"]["time"]
-        time = dt.strptime(time,'%H:%M:%S')
-        if summertime:
-            time = time + timedelta(hours=1) # adjust starttimes for summertime
-        if not( (time_now-time).days > -1 ): # if starttime is ahead of us
-            upcoming_games.append((time, id)) # appending (time, id)
-        else:
-            past_games.append((time, id))
 
-    # Sort the list
-    upcoming_games.sort()
+async def async_main(token, notifications_channel, errors_channel, logs_channel, sportmonks_token, worker_id=None, snapshots=None, parse_pool=None, worker_index=None):
+    """
+    Event loop running every observer as a coroutine on a single thread
 
-    # Print past and upcoming games
-    print(f'Past games today:\n {list(map(lambda g: "game %s at %s"%(str(g[1]), str(g[0].time())), past_games))}\n')
-    print(f'Upcoming games:\n {list(map(lambda g: "game %s at %s"%(str(g[1]), str(g[0].time())), upcoming_games))}\n')
+    worker_id: Unique name of this worker when the fixtures are sharded
+    worker_index: Index of this process when shard_processes worker processes share the fixtures, None for the parent
+    snapshots: State_snapshot to resume from and save to, None to start cold
+    parse_pool: Parse_pool decoding the responses off the event loop, None to decode them on it
+    """
 
-    return upcoming_games
+    # Create the slack dispatcher and logger shared by all observers
+    dispatcher = Slack_dispatcher(token, priority_channels=[notifications_channel]).start()
+    application_logger = Slack_message_bot(token, logs_channel, dispatcher=dispatcher)
+    application_logger.connect()
+    error_logger = Slack_message_bot(token, errors_channel, dispatcher=dispatcher, coalesce=True)
+
+    # Create the sportmonks clients and livescores poller shared by all observers, both clients draw from one budget and share one circuit breaker
+    client = new_sportmonks_client(sportmonks_token)
+    session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=import_setting('max_connections', 100)))
+    async_client = Async_sportmonks_client(sportmonks_token, session, client.bucket, breaker=client.breaker, latencies=client.latencies)
+    poller = Async_livescores_poller(async_client, parse_pool=parse_pool)
+    cache = Metadata_cache(import_setting('metadata_cache_file', 'metadata_cache.json'))
+    scheduler = Kickoff_scheduler(client, import_setting('timezone', 'Europe/Stockholm'))
+    baselines = new_team_baselines()
+    observers = set()
+
+    # Start an observer task as soon as its game is reported live, all pending games are checked in one request
+    def start_observer(game_id, fixture, snapshot=None):
+        print("Starting task with new observer")
+        task = asyncio.create_task(new_async_game_observer(game_id, sportmonks_token, notifications_channel, errors_channel, token, async_client, poller, cache, dispatcher, fixture, snapshots, snapshot, baselines, parse_pool))
+        observers.add(task) # keep a reference until the observer is done
+        task.add_done_callback(observers.discard)
+        application_logger.post_message(f"*{game_id}:* Observer {'resumed' if snapshot else 'started'}")
+
+    watcher = Async_status_watcher(async_client, start_observer, lambda game_id: error_logger.post_message(f'*{game_id}:* Game never reported to be live in its first 15 mins'))
+    observers.add(asyncio.create_task(watcher.run()))
+    coordinator = new_coordinator(watcher.watch, worker_id)
+
+    # Resume the games of the last snapshot right away, then keep saving snapshots
+    state = snapshots.load() if snapshots else None
+    if state:
+        print(f"Resumed from snapshot: {resume_from_snapshot(state, scheduler, watcher, start_observer, coordinator)}")
+    if snapshots:
+        snapshots.start(scheduler, watcher)
+
+    # Fetch the schedule of today and tomorrow
+    await asyncio.to_thread(refresh_schedule, scheduler, application_logger)
+    current_day = scheduler.now().date()
+
+    # Compute the team baselines in the background if last night's are missing
+    if baselines_due(baselines, scheduler, worker_index):
+        observers.add(asyncio.create_task(asyncio.to_thread(update_baselines, baselines, scheduler, client, application_logger)))
+    print(f'Upcoming games:\n {format_games(scheduler.upcoming())}\n')
 
+    # Notify application started
+    application_logger.post_message('Application started')
+
+    # Event loop, waking up at the next kickoff or schedule refresh
+    while True:
+        for active_game in scheduler.due():
+            if coordinator and not coordinator.offer(active_game):
+                continue # observed by another worker
+            watcher.watch(active_game)
+
+        # Pick up late changes of the schedule, and baselines built by another worker
+        if scheduler.refresh_due():
+            await asyncio.to_thread(refresh_schedule, scheduler, application_logger)
+            baselines.refresh()
+
+        # If a new day begins: log its upcoming games
+        if scheduler.now().date() != current_day:
+            current_day = scheduler.now().date()
+            application_logger.post_message(f'*Upcoming games {current_day}:* {format_games(scheduler.upcoming())}')
+            application_logger.post_message(f'*Metadata cache:* {cache.stats()}')
+            application_logger.post_message(f'*Slack dispatcher:* {dispatcher.stats()}')
+            if coordinator:
+                application_logger.post_message(f'*Workers:* {coordinator.stats()}')
+            if baselines_due(baselines, scheduler, worker_index):
+                observers.add(asyncio.create_task(asyncio.to_thread(update_baselines, baselines, scheduler, client, application_logger)))
+
+        await asyncio.sleep(scheduler.seconds_until_next())
+
+
+def main(worker_index=None):
+    """
+    worker_index: Index of this process when shard_processes worker processes share the fixtures, None for the parent
+    """
 
-def main():
     # Import credentials
     token, notifications_channel, errors_channel, logs_channel, sportmonks_token = import_credentials()
 
-    # Create logger and establish its connection
-    application_logger = Slack_message_bot(token, logs_channel)
+    # Split the fixtures between several worker processes, every container can run its own
+    shard_processes = import_setting('shard_processes', 1)
+    if worker_index is None and shard_processes > 1:
+        if not import_setting('shard_dir'):
+            raise Exception("shard_processes requires a shard_dir shared by the worker processes")
+        workers = [multiprocessing.Process(target=main, args=(i,)) for i in range(shard_processes)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        return
+    worker_id = import_setting('worker_id', default_worker_id())
+    if worker_index is not None:
+        worker_id = f"{worker_id}-{worker_index}"
+
+    # Serve the metrics for Prometheus on http://host:5000/metrics, worker processes use the following ports
+    metrics_port = import_setting('metrics_port', 5000)
+    if metrics_port:
+        Metrics_server(port=metrics_port + (worker_index or 0)).start()
+
+    # Snapshot the state of the process, so a restart resumes the games in progress
+    snapshots = new_state_snapshot(worker_index)
+
+    # Decode the responses in worker processes, sharded worker processes already use the other cores
+    parse_workers = import_setting('parse_workers', default_workers() if worker_index is None else 0)
+    parse_pool = Parse_pool(parse_workers) if parse_workers else None
+
+    # Run every observer on one event loop instead of one thread per game
+    if import_setting('run_mode', 'threads') == 'asyncio':
+        asyncio.run(async_main(token, notifications_channel, errors_channel, logs_channel, sportmonks_token, worker_id, snapshots, parse_pool, worker_index))
+        return
+
+    # Create the slack dispatcher and logger shared by all observers
+    dispatcher = Slack_dispatcher(token, priority_channels=[notifications_channel]).start()
+    application_logger = Slack_message_bot(token, logs_channel, dispatcher=dispatcher)
     application_logger.connect()
-
-    # Save the current timestamp
-    current_day = dt.now()
-
-    # Fetch upcoming games today
-    fetch_upcoming_games(sportmonks_token, True) # CURRENTLY: summertime == True
+    error_logger = Slack_message_bot(token, errors_channel, dispatcher=dispatcher, coalesce=True)
+
+    # Create the sportmonks client and livescores poller shared by all observers
+    client = new_sportmonks_client(sportmonks_token)
+    poller = Livescores_poller(client, parse_pool=parse_pool)
+    cache = Metadata_cache(import_setting('metadata_cache_file', 'metadata_cache.json'))
+    baselines = new_team_baselines()
+
+    # Evaluate every live fixture in one NumPy pass instead of one evaluate_situation per thread
+    batch = None
+    if import_setting('run_mode', 'threads') == 'vectorised':
+        strategy = load_class(import_setting('vectorised_strategy', 'Vectorised_evaluation:Vectorised_strategy'))()
+        batch = Batch_observer(strategy, sportmonks_token, notifications_channel, errors_channel, token, poller, client, cache, dispatcher, snapshots, baselines, parse_pool)
+        _thread.start_new_thread(batch.run, ())
+
+    # Start an observer as soon as its game is reported live, all pending games are checked in one request
+    def start_observer(game_id, fixture, snapshot=None):
+        if batch:
+            batch.add(game_id, fixture, snapshot)
+            application_logger.post_message(f"*{game_id}:* {'Resumed in' if snapshot else 'Added to'} the vectorised evaluation")
+            return
+        print("Starting thread with new observer")
+        try:
+            _thread.start_new_thread(new_game_observer, (game_id, sportmonks_token, notifications_channel, errors_channel, token, poller, client, cache, dispatcher, fixture, snapshots, snapshot, baselines, parse_pool))
+            application_logger.post_message(f"*{game_id}:* Observer {'resumed' if snapshot else 'started'}")
+        except:
+            application_logger.post_message(f"*{game_id} Exception:* The thread for this observer could not start")
+
+    watcher = Status_watcher(client, start_observer, lambda game_id: error_logger.post_message(f'*{game_id}:* Game never reported to be live in its first 15 mins'))
+    _thread.start_new_thread(watcher.run, ())
+    coordinator = new_coordinator(watcher.watch, worker_id)
+    scheduler = Kickoff_scheduler(client, import_setting('timezone', 'Europe/Stockholm'))
+
+    # Resume the games of the last snapshot right away, then keep saving snapshots
+    state = snapshots.load() if snapshots else None
+    if state:
+        print(f"Resumed from snapshot: {resume_from_snapshot(state, scheduler, watcher, start_observer, coordinator)}")
+    if snapshots:
+        snapshots.start(scheduler, watcher)
+
+    # Fetch the schedule of today and tomorrow
+    refresh_schedule(scheduler, application_logger)
+    current_day = scheduler.now().date()
+
+    # Compute the team baselines in the background if last night's are missing
+    if baselines_due(baselines, scheduler, worker_index):
+        _thread.start_new_thread(update_baselines, (baselines, scheduler, client, application_logger))
+    print(f'Upcoming games:\n {format_games(scheduler.upcoming())}\n')
 
     # Notify application started
     application_logger.post_message('Application started')
 
-    # Event loop
+    # Event loop, waking up at the next kickoff or schedule refresh
     while True:
-        active_game = currently_active_game()
-        if active_game:
-            print("Starting thread with new observer")
-            try:
-                _thread.start_new_thread(new_game_observer, (active_game, sportmonks_token, notifications_channel, errors_channel, token))
-                application_logger.post_message(f"*{active_game}:* Observer started")
-            except:
-                application_logger.post_message(f"*{active_game} Exception:* The thread for this observer could not start")
-        time.sleep(120)
-
-        # If a new day begins: fetch upcoming games & refresh the current_day
-        if (current_day.day - dt.now().day == -1):
-            current_day = dt.now()
-            upcoming = fetch_upcoming_games(sportmonks_token, True)
-            application_logger.post_message(f'*Upcoming games {str(current_day)[:10]}:* {str(list(map(lambda g: "game %s at %s"%(str(g[1]), str(g[0].time())), upcoming_games)))}')
+        for active_game in scheduler.due():
+            if coordinator and not coordinator.offer(active_game):
+                continue # observed by another worker
+            watcher.watch(active_game)
+
+        # Pick up late changes of the schedule, and baselines built by another worker
+        if scheduler.refresh_due():
+            refresh_schedule(scheduler, application_logger)
+            baselines.refresh()
+
+        # If a new day begins: log its upcoming games
+        if scheduler.now().date() != current_day:
+            current_day = scheduler.now().date()
+            application_logger.post_message(f'*Upcoming games {current_day}:* {format_games(scheduler.upcoming())}')
+            application_logger.post_message(f'*Metadata cache:* {cache.stats()}')
+            application_logger.post_message(f'*Slack dispatcher:* {dispatcher.stats()}')
+            if coordinator:
+                application_logger.post_message(f'*Workers:* {coordinator.stats()}')
+            if baselines_due(baselines, scheduler, worker_index):
+                _thread.start_new_thread(update_baselines, (baselines, scheduler, client, application_logger))
+
+        time.sleep(scheduler.seconds_until_next())
 
 if __name__ == "__main__":
     main()